@@ -2,9 +2,11 @@ from pyfirmata2 import Arduino, PWM
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import numpy as np
-from py_iir_filter.iir_filter import IIR_filter
-from scipy.signal import butter
+from py_iir_filter.retune import IIR_filter_retunable
+from py_iir_filter.ring_buffer import RingBuffer
+from py_iir_filter.spectrum import SlidingDFT, WelchPSD
 import tkinter as tk
+import threading
 import time
 
 # ' Constants
@@ -22,7 +24,7 @@ WIDTH = 15  # inches
 HEIGHT = WIDTH * (9 / 16)  # 16:9 aspect ratio
 
 # ' Arduino Setup
-board = Arduino(PORT)
+board = Arduino(PORT, event_driven=True)  # wake up only when data arrives
 board.samplingOn(1000 / SAMPLING_RATE)
 
 # ' Set the pins as PWM output
@@ -32,8 +34,11 @@ board.digital[LED_BLUE_PIN].mode = PWM
 # ' IIR filter:
 LP_CUTOFF = 10  # Hz
 NYQUIST_RATE = SAMPLING_RATE / 2
-sos = butter(2, LP_CUTOFF / NYQUIST_RATE, btype='low', output='sos')
-iir_filter = IIR_filter(sos)
+# the cutoff can be changed live from the GUI; all designs are precomputed
+# so retuning neither calls the design function nor resets the filter:
+LP_CUTOFFS = np.arange(1, NYQUIST_RATE)  # Hz
+iir_filter = IIR_filter_retunable(LP_CUTOFFS, order=2, btype='low', fs=SAMPLING_RATE)
+iir_filter.set_cutoff(LP_CUTOFF)
 
 # ' Plotting:
 # initialized to none so they will be created in setup_plotting()
@@ -42,13 +47,58 @@ line_time = None
 filtered_line_time = None
 line_freq = None
 filtered_line_freq = None
-time_domain_data = np.zeros(BUFFER_SIZE)
-filtered_time_domain_data = np.zeros(BUFFER_SIZE)
-freq_domain_data = np.zeros(BUFFER_SIZE // 2)
-filtered_freq_domain_data = np.zeros(BUFFER_SIZE // 2)
-
-# current sample from pin:
+# ring buffers with O(1) append and a zero-copy view of the samples in order:
+time_domain_data = RingBuffer(BUFFER_SIZE)
+filtered_time_domain_data = RingBuffer(BUFFER_SIZE)
+# The frequency panel shows either the magnitude spectrum of sliding DFTs
+# which update the positive frequency bins with every new sample (default)
+# or, with WELCH_PSD, an averaged Welch PSD which is calculated in the
+# background a few times per second:
+WELCH_PSD = False
+PSD_RATE = 10  # updates per second
+buffer_lock = threading.Lock()
+
+
+def snapshot(buffer):
+    # copy of a ring buffer which is not torn by a concurrent extend()
+    def source():
+        with buffer_lock:
+            return buffer.copy()
+    return source
+
+
+if WELCH_PSD:
+    psd = WelchPSD(snapshot(time_domain_data), SAMPLING_RATE, nperseg=128, rate=PSD_RATE)
+    filtered_psd = WelchPSD(snapshot(filtered_time_domain_data), SAMPLING_RATE, nperseg=128, rate=PSD_RATE)
+else:
+    FREQ_BINS = np.arange(1, (BUFFER_SIZE + 1) // 2)
+    freq_domain_data = SlidingDFT(BUFFER_SIZE, FREQ_BINS)
+    filtered_freq_domain_data = SlidingDFT(BUFFER_SIZE, FREQ_BINS)
+    fft_freq = freq_domain_data.frequencies(SAMPLING_RATE)
+
+
+# Thread-safe queue of all sample blocks from the board's thread to the GUI:
+class SampleQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = []
+
+    def put(self, values):
+        with self._lock:
+            self._blocks.append(values)
+
+    def drain(self):
+        # swap the list so that the board's thread is blocked only briefly
+        with self._lock:
+            blocks, self._blocks = self._blocks, []
+        return np.concatenate(blocks) if blocks else np.zeros(0)
+
+
+sample_queue = SampleQueue()
+
+# latest raw and filtered sample (used to update the LED):
 current_sample = 0.0
+filtered_data = 0.0
 
 # Make a button to toggle between using filtered data or not in real time:
 use_filtered_data = False
@@ -87,7 +137,7 @@ def setup_gui():
 
     # Set the initial size of the window (width x height)
     window_width = 300
-    window_height = 80
+    window_height = 150
     screen_width = root.winfo_screenwidth()
     screen_height = root.winfo_screenheight()
     x_coordinate = (screen_width / 2) - (window_width / 2)
@@ -102,8 +152,15 @@ def setup_gui():
     text = "Using filtered data to update LED.." if use_filtered_data else "NOT using filtered data to update LED.."
     status_text = tk.Label(root, text=text)
 
+    # Slider to retune the low-pass cutoff in real time
+    cutoff_slider = tk.Scale(root, from_=LP_CUTOFFS[0], to=LP_CUTOFFS[-1], orient=tk.HORIZONTAL,
+                             label="Low-pass cutoff (Hz)", length=window_width - 20,
+                             command=lambda value: iir_filter.set_cutoff(float(value)))
+    cutoff_slider.set(LP_CUTOFF)
+
     status_text.pack()
     toggle_button.pack()
+    cutoff_slider.pack()
 
     return root
 
@@ -128,17 +185,22 @@ def setup_plotting(fig, ax_time, ax_freq, time_domain_data, line_time, line_freq
     ax_time.set_title('Time Domain')
     ax_time.set_ylim(-0.1, 1.1)
     line_time, = ax_time.plot(np.arange(BUFFER_SIZE),
-                              time_domain_data, label='X-axis value')
+                              time_domain_data.view(), label='X-axis value')
     filtered_line_time, = ax_time.plot(np.arange(
-        BUFFER_SIZE), filtered_time_domain_data, label='Filtered X-axis value')
+        BUFFER_SIZE), filtered_time_domain_data.view(), label='Filtered X-axis value')
     ax_time.legend()  # Add legend for time domain plot
 
     # Frequency Domain Plot
     ax_freq.set_xlabel('Frequency')
-    ax_freq.set_ylabel('Amplitude')
     ax_freq.set_title('Frequency Domain')
     ax_freq.set_xlim(0, SAMPLING_RATE / 2)
-    ax_freq.set_ylim(0, 50)
+    if WELCH_PSD:
+        ax_freq.set_ylabel('PSD (1/Hz)')
+        ax_freq.set_yscale('log')
+        ax_freq.set_ylim(1e-9, 1e-1)
+    else:
+        ax_freq.set_ylabel('Amplitude')
+        ax_freq.set_ylim(0, 50)
     line_freq, = ax_freq.plot([], [], label='X-axis value')
     filtered_line_freq, = ax_freq.plot([], [], label='Filtered X-axis value')
     ax_freq.legend()  # Add legend for frequency domain plot
@@ -148,43 +210,52 @@ def setup_plotting(fig, ax_time, ax_freq, time_domain_data, line_time, line_freq
 
 # Function to Update Plots
 def update(frame):
-    global time_domain_data, filtered_time_domain_data, current_sample, use_filtered_data
+    global time_domain_data, filtered_time_domain_data, current_sample, filtered_data, use_filtered_data
     
     check_sampling_rate()
-    
-    if current_sample is not None:
-        # Update Time Domain Data
-        # store raw data:
-        time_domain_data = np.roll(time_domain_data, -1)
-        time_domain_data[-1] = current_sample
 
-        # Apply filter:
-        filtered_data = iir_filter.filter(current_sample)
-        filtered_time_domain_data = np.roll(filtered_time_domain_data, -1)
-        filtered_time_domain_data[-1] = filtered_data
+    # all samples which arrived since the last frame:
+    samples = sample_queue.drain()
 
-        # plot time domain data:
-        line_time.set_ydata(time_domain_data)
-        filtered_line_time.set_ydata(filtered_time_domain_data)
+    if len(samples):
+        # Update Time Domain Data
+        # Apply filter to the whole backlog at once:
+        filtered = iir_filter.filter_block(samples)
 
-        # Update Frequency Domain Data
-        fft_data = np.fft.fft(time_domain_data)
-        filtered_fft_data = np.fft.fft(filtered_time_domain_data)
-        # get the frequency bins:
-        fft_freq = np.fft.fftfreq(BUFFER_SIZE, 1 / SAMPLING_RATE)
+        # store raw and filtered data:
+        with buffer_lock:
+            time_domain_data.extend(samples)
+            filtered_time_domain_data.extend(filtered)
+        current_sample = samples[-1]
+        filtered_data = filtered[-1]
 
-        # plot the data:
-        mask = fft_freq > 0  # Only plot the positive frequencies
-        line_freq.set_data(fft_freq[mask], np.abs(fft_data[mask]))
-        filtered_line_freq.set_data(
-            fft_freq[mask], np.abs(filtered_fft_data[mask]))
+        # plot time domain data:
+        line_time.set_ydata(time_domain_data.view())
+        filtered_line_time.set_ydata(filtered_time_domain_data.view())
+
+        if not WELCH_PSD:
+            # Update Frequency Domain Data (only the positive frequencies)
+            freq_domain_data.update_block(samples)
+            filtered_freq_domain_data.update_block(filtered)
+
+            # plot the data:
+            line_freq.set_data(fft_freq, freq_domain_data.magnitude())
+            filtered_line_freq.set_data(fft_freq, filtered_freq_domain_data.magnitude())
+
+    if WELCH_PSD:
+        # latest estimates of the background threads (without DC):
+        f, p = psd.get()
+        if p is not None:
+            line_freq.set_data(f[1:], p[1:])
+        f, p = filtered_psd.get()
+        if p is not None:
+            filtered_line_freq.set_data(f[1:], p[1:])
 
     # Update LED
     if use_filtered_data:
         # max value for filtered data is 1 and min is 0. Check that is true:
-        filtered_data = np.clip(filtered_data, 0, 1)
         #print(f"Filtered data: {filtered_data}")
-        update_led_colour(filtered_data)
+        update_led_colour(np.clip(filtered_data, 0, 1))
     else:
         #print(f"Raw data: {current_sample}")
         update_led_colour(current_sample)
@@ -201,11 +272,15 @@ def init():
     return line_time, line_freq, filtered_line_time, filtered_line_freq
 
 
-# Arduino Callback for LED Update
-def callback(value):
-    global current_sample, sample_count
-    current_sample = value
-    sample_count += 1
+# Arduino Callback for LED Update (receives blocks of samples)
+BLOCK_SIZE = 10  # samples
+BLOCK_LATENCY = 0.02  # s
+
+
+def callback(timestamps, values):
+    global sample_count
+    sample_queue.put(values)
+    sample_count += len(values)
 
 # Setup everything related to plotting:
 fig, (ax_time, ax_freq), time_domain_data, line_time, line_freq, filtered_time_domain_data, filtered_line_time, filtered_line_freq = setup_plotting(
@@ -215,9 +290,13 @@ fig, (ax_time, ax_freq), time_domain_data, line_time, line_freq, filtered_time_d
 ani = animation.FuncAnimation(
     fig, update, init_func=init, blit=True, interval=1, cache_frame_data=False)
 
-board.analog[X_AXIS_INPUT].register_callback(callback)
+board.analog[X_AXIS_INPUT].register_block_callback(callback, block_size=BLOCK_SIZE, max_latency=BLOCK_LATENCY)
 board.analog[X_AXIS_INPUT].enable_reporting()
 
+if WELCH_PSD:
+    psd.start()
+    filtered_psd.start()
+
 try:
     root = setup_gui()
     plt.tight_layout()
@@ -228,6 +307,9 @@ except KeyboardInterrupt:
 
 finally:
     # Cleanup:
+    if WELCH_PSD:
+        psd.stop()
+        filtered_psd.stop()
     board.digital[LED_BLUE_PIN].write(0)
     board.digital[LED_RED_PIN].write(0)
     board.exit()
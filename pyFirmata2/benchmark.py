@@ -0,0 +1,154 @@
+"""
+Microbenchmark of the dispatching of incoming Firmata messages.
+
+Compares the current Board, which looks up the handlers in precomputed
+status byte tables, with the same bulk reading parser dispatching
+through a dict of handlers which are wrapped in a closure.
+
+Usage: python benchmark.py [number of messages]
+"""
+from __future__ import division, print_function
+
+import inspect
+import sys
+import time
+
+import pyfirmata2
+from pyfirmata2.boards import BOARDS
+
+
+class BufferSerial(object):
+    """In memory serial port which reads from a fixed buffer."""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+
+    def read(self, count=1):
+        chunk = self.data[self.pos:self.pos + count]
+        self.pos += len(chunk)
+        return chunk
+
+    def inWaiting(self):
+        return len(self.data) - self.pos
+
+    def close(self):
+        pass
+
+
+class LegacyBoard(pyfirmata2.Board):
+    """Board with the previous dict and wrapper based dispatch."""
+
+    def add_cmd_handler(self, cmd, func):
+        len_args = len(inspect.getfullargspec(func)[0])
+
+        def add_meta(f):
+            def decorator(*args, **kwargs):
+                f(*args, **kwargs)
+            decorator.bytes_needed = len_args - 1  # exclude self
+            decorator.__name__ = f.__name__
+            return decorator
+        func = add_meta(func)
+        self._command_handlers[cmd] = func
+
+    def iterate(self):
+        data = self.sp.read(max(self.bytes_available(), 1))
+        if not data:
+            return
+        for handler, received_data in self._parse(bytearray(data)):
+            try:
+                handler(*received_data)
+            except ValueError:
+                pass
+
+    def _parse(self, data):
+        handlers = self._command_handlers
+        handler = self._command
+        stored = self._stored_data
+        sysex = self._parsing_sysex
+        messages = []
+        for byte in data:
+            if byte < 0x80:
+                if sysex:
+                    stored.append(byte)
+                elif handler is not None:
+                    stored.append(byte)
+                    if len(stored) == handler.bytes_needed:
+                        messages.append((handler, stored))
+                        handler = None
+                continue
+            if sysex:
+                sysex = False
+                if byte == pyfirmata2.END_SYSEX:
+                    if stored:
+                        sysex_handler = handlers.get(stored[0])
+                        if sysex_handler is not None:
+                            messages.append((sysex_handler, stored[1:]))
+                    continue
+            if byte == pyfirmata2.START_SYSEX:
+                sysex = True
+                handler = None
+                stored = []
+                continue
+            if byte < pyfirmata2.START_SYSEX:
+                handler = handlers.get(byte & 0xF0)
+                stored = [byte & 0x0F]
+            else:
+                handler = handlers.get(byte)
+                stored = []
+            if handler is not None and len(stored) >= handler.bytes_needed:
+                messages.append((handler, stored))
+                handler = None
+        self._command = handler
+        self._stored_data = stored
+        self._parsing_sysex = sysex
+        return messages
+
+
+def make_board(cls, data):
+    """Board on an in memory serial port with all analog pins reporting."""
+    board = cls.__new__(cls)
+    board.samplerThread = None
+    board._command_handlers = {}
+    board.sp = BufferSerial(data)
+    board.setup_layout(BOARDS['arduino'])
+    board.count = 0
+
+    def callback(value):
+        board.count += 1
+
+    for pin in board.analog:
+        pin.reporting = True
+        pin.callback = callback
+    return board
+
+
+def analog_stream(messages, channels=6):
+    data = bytearray()
+    for i in range(messages):
+        value = i % 1024
+        data += bytearray([pyfirmata2.ANALOG_MESSAGE + i % channels, value % 128, value >> 7])
+    return data
+
+
+def run(cls, data, messages):
+    board = make_board(cls, data)
+    t0 = time.perf_counter()
+    while board.bytes_available():
+        board.iterate()
+    elapsed = time.perf_counter() - t0
+    assert board.count == messages
+    return messages / elapsed
+
+
+def main(messages=100000):
+    data = analog_stream(messages)
+    before = run(LegacyBoard, data, messages)
+    after = run(pyfirmata2.Board, data, messages)
+    print("before: {:10.0f} messages/sec".format(before))
+    print("after:  {:10.0f} messages/sec".format(after))
+    print("speedup: {:.1f}x".format(after / before))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
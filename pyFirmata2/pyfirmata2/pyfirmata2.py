@@ -8,7 +8,7 @@ import serial
 import serial.tools.list_ports
 from sys import platform
 
-from .util import pin_list_to_board_dict, to_two_bytes, two_byte_iter_to_str, Iterator
+from .util import pin_list_to_board_dict, to_two_bytes, two_byte_iter_to_str, BlockCallback, Iterator
 
 
 # Message command bytes (0x80(128) to 0xFF(255)) - straight from Firmata.h
@@ -67,6 +67,9 @@ DIGITAL = OUTPUT   # same as OUTPUT below
 # Time to wait after initializing serial, used in Board.__init__
 BOARD_SETUP_WAIT_TIME = 5
 
+# Normalised values of the 10 bit analog readings
+ANALOG_LUT = tuple(round(i / 1023, 4) for i in range(1024))
+
 
 class PinAlreadyTakenError(Exception):
     pass
@@ -86,12 +89,26 @@ class Board(object):
     firmware = None
     firmware_version = None
     _command_handlers = {}
+    # status byte -> (handler, number of arguments) and sysex command -> handler,
+    # per board copies are created by add_cmd_handler
+    _dispatch = (None,) * 256
+    _sysex_dispatch = (None,) * 128
     _command = None
     _stored_data = []
     _parsing_sysex = False
+    raw_analog = False
+    _block_callbacks = ()
     AUTODETECT = None
 
-    def __init__(self, port, layout=None, baudrate=57600, name=None, timeout=None, debug=False):
+    def __init__(self, port, layout=None, baudrate=57600, name=None, timeout=None, debug=False,
+                 event_driven=False, raw_analog=False):
+        """
+        Connects to a board. With ``event_driven`` the sampling thread
+        blocks on the serial port until data arrives instead of polling it
+        every millisecond. With ``raw_analog`` the analog pins report the
+        integer ADC counts instead of values from 0 to 1.
+        """
+        self.raw_analog = raw_analog
         if port == self.AUTODETECT:
             l = serial.tools.list_ports.comports()
             if l:
@@ -118,7 +135,7 @@ class Board(object):
             raise Exception('Could not find a serial port.')
         if debug:
             print("Port=",port)
-        self.samplerThread = Iterator(self)
+        self.samplerThread = Iterator(self, event_driven=event_driven)
         self.sp = serial.Serial(port, baudrate, timeout=timeout)
         # Allow 5 secs for Arduino's auto-reset to happen
         # Alas, Firmata blinks its version before printing it to serial
@@ -230,17 +247,31 @@ class Board(object):
             raise IOError("Board detection failed.")
 
     def add_cmd_handler(self, cmd, func):
-        """Adds a command handler for a command."""
-        len_args = len(inspect.getfullargspec(func)[0])
-
-        def add_meta(f):
-            def decorator(*args, **kwargs):
-                f(*args, **kwargs)
-            decorator.bytes_needed = len_args - 1  # exclude self
-            decorator.__name__ = f.__name__
-            return decorator
-        func = add_meta(func)
+        """
+        Adds a command handler for a command. The number of bytes the
+        handler needs is taken from its arguments once here and stored
+        with it in the dispatch tables which are indexed by the status
+        byte or the sysex command. Every positional argument counts
+        except for the ones which are already bound, like the ``self``
+        of a method or the arguments of a partial. (Before, one argument
+        was always subtracted so that plain functions received one byte
+        less than they had arguments.)
+        """
+        if '_dispatch' not in self.__dict__:
+            self._command_handlers = {}
+            self._dispatch = [None] * 256
+            self._sysex_dispatch = [None] * 128
+        len_args = sum(1 for p in inspect.signature(func).parameters.values()
+                       if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
         self._command_handlers[cmd] = func
+        if cmd < 0x80:
+            self._sysex_dispatch[cmd] = func
+        elif cmd < START_SYSEX:
+            # the lower 4 bits of the status byte are the channel
+            for channel in range(16):
+                self._dispatch[(cmd & 0xF0) | channel] = (func, len_args)
+        else:
+            self._dispatch[cmd] = (func, len_args)
 
     def get_pin(self, pin_def):
         """
@@ -317,43 +348,125 @@ class Board(object):
         Reads and handles data from the microcontroller over the serial port.
         This method should be called in a main loop or in an :class:`Iterator`
         instance to keep this boards pin values up to date.
+
+        All bytes waiting in the serial buffer are read at once. Messages
+        which are split over several reads are completed by the next call.
         """
-        byte = self.sp.read()
-        if not byte:
+        data = self.sp.read(max(self.bytes_available(), 1))
+        if not data:
             return
-        data = ord(byte)
-        received_data = []
-        handler = None
-        if data < START_SYSEX:
-            # These commands can have 'channel data' like a pin nummber appended.
-            try:
-                handler = self._command_handlers[data & 0xF0]
-            except KeyError:
-                return
-            received_data.append(data & 0x0F)
-            while len(received_data) < handler.bytes_needed:
-                received_data.append(ord(self.sp.read()))
-        elif data == START_SYSEX:
-            data = ord(self.sp.read())
-            handler = self._command_handlers.get(data)
-            if not handler:
-                return
-            data = ord(self.sp.read())
-            while data != END_SYSEX:
-                received_data.append(data)
-                data = ord(self.sp.read())
-        else:
-            try:
-                handler = self._command_handlers[data]
-            except KeyError:
-                return
-            while len(received_data) < handler.bytes_needed:
-                received_data.append(ord(self.sp.read()))
-        # Handle the data
+        self._parse(bytearray(data))
+
+    def _parse(self, data):
+        """
+        Incremental parser of the Firmata byte stream which calls the
+        handlers of the complete messages. The message being received is
+        kept in ``_command``, ``_stored_data`` and ``_parsing_sysex``
+        between calls. Fixed length messages whose data bytes are all in
+        ``data`` are passed to their handlers directly, the others are
+        collected byte by byte.
+        """
+        dispatch = self._dispatch
+        entry = self._command
+        stored = self._stored_data
+        sysex = self._parsing_sysex
+        i = 0
+        n = len(data)
         try:
-            handler(*received_data)
-        except ValueError:
-            pass
+            while i < n:
+                byte = data[i]
+                i += 1
+                if byte < 0x80:
+                    # data byte
+                    if sysex:
+                        stored.append(byte)
+                    elif entry is not None:
+                        stored.append(byte)
+                        if len(stored) == entry[1]:
+                            handler = entry[0]
+                            entry = None
+                            try:
+                                handler(*stored)
+                            except ValueError:
+                                pass
+                    # else: a stray data byte which belongs to no message
+                    continue
+                if sysex:
+                    sysex = False
+                    if byte == END_SYSEX:
+                        # the first byte is the sysex command
+                        if stored:
+                            handler = self._sysex_dispatch[stored[0]]
+                            if handler is not None:
+                                try:
+                                    handler(*stored[1:])
+                                except ValueError:
+                                    pass
+                        continue
+                    # a status byte within a sysex aborts it
+                if byte == START_SYSEX:
+                    sysex = True
+                    entry = None
+                    stored = []
+                    continue
+                entry = dispatch[byte]
+                if entry is None:
+                    continue
+                if byte < START_SYSEX:
+                    # These commands have 'channel data' like a pin number appended.
+                    if entry[1] == 3 and i + 1 < n and data[i] < 0x80 and data[i + 1] < 0x80:
+                        # fast path: the two data bytes are already here
+                        handler = entry[0]
+                        entry = None
+                        i += 2
+                        try:
+                            handler(byte & 0x0F, data[i - 2], data[i - 1])
+                        except ValueError:
+                            pass
+                        continue
+                    stored = [byte & 0x0F]
+                else:
+                    if entry[1] == 2 and i + 1 < n and data[i] < 0x80 and data[i + 1] < 0x80:
+                        # fast path of system messages like REPORT_VERSION
+                        handler = entry[0]
+                        entry = None
+                        i += 2
+                        try:
+                            handler(data[i - 2], data[i - 1])
+                        except ValueError:
+                            pass
+                        continue
+                    stored = []
+                if len(stored) >= entry[1]:
+                    handler = entry[0]
+                    entry = None
+                    try:
+                        handler(*stored)
+                    except ValueError:
+                        pass
+        finally:
+            # also keep the state if a handler raises
+            self._command = entry
+            self._stored_data = stored
+            self._parsing_sysex = sysex
+
+    def check_block_callbacks(self):
+        """
+        Hands over the blocks of the block callbacks whose latency
+        deadline has passed. Called by the :class:`Iterator`.
+        """
+        if self._block_callbacks:
+            now = time.time()
+            for block_callback in self._block_callbacks:
+                block_callback.check(now)
+
+    def next_block_deadline(self):
+        """
+        Returns the earliest time (as time.time()) at which a block
+        callback has to hand over its samples or None.
+        """
+        deadlines = [b.deadline for b in self._block_callbacks if b.count and b.deadline is not None]
+        return min(deadlines) if deadlines else None
 
     def get_firmata_version(self):
         """
@@ -398,15 +511,20 @@ class Board(object):
 
     # Command handlers
     def _handle_analog_message(self, pin_nr, lsb, msb):
-        value = round(float((msb << 7) + lsb) / 1023, 4)
-        # Only set the value if we are actually reporting
         try:
-            if self.analog[pin_nr].reporting:
-                self.analog[pin_nr].value = value
-                if not self.analog[pin_nr].callback is None:
-                    self.analog[pin_nr].callback(value)
+            pin = self.analog[pin_nr]
         except IndexError:
             raise ValueError
+        # Only set the value if we are actually reporting
+        if pin.reporting:
+            value = (msb << 7) + lsb
+            if not pin.raw:
+                value = ANALOG_LUT[value] if value < 1024 else round(value / 1023, 4)
+            pin.value = value
+            if not pin.callback is None:
+                pin.callback(value)
+            if not pin.block_callback is None:
+                pin.block_callback.append(value)
 
     def _handle_digital_message(self, port_nr, lsb, msb):
         """
@@ -499,6 +617,8 @@ class Port(object):
                     pin.value = (mask & (1 << pin_nr)) > 0
                     if not pin.callback is None:
                         pin.callback(pin.value)
+                    if not pin.block_callback is None:
+                        pin.block_callback.append(pin.value)
 
 
 class Pin(object):
@@ -513,6 +633,9 @@ class Pin(object):
         self.reporting = False
         self.value = None
         self.callback = None
+        self.block_callback = None
+        # analog input: report the integer ADC counts instead of 0 to 1
+        self.raw = board.raw_analog
 
     def __str__(self):
         type = {ANALOG: 'Analog', DIGITAL: 'Digital'}[self.type]
@@ -586,6 +709,7 @@ class Pin(object):
         :arg value: callback with one argument which receives the data:
         boolean if the pin is digital, or 
         float from 0 to 1 if the pin is an analgoue input
+        (the integer ADC value if ``raw`` is set)
         """        
         self.callback = _callback
 
@@ -595,6 +719,33 @@ class Pin(object):
         """
         self.callback = None
 
+    def register_block_callback(self, _callback, block_size=None, max_latency=None):
+        """
+        Register a callback which receives the data of the pin in blocks
+        instead of sample by sample. Needs numpy.
+
+        :arg _callback: callback with two arguments: numpy arrays of the
+            arrival times (as time.time()) and of the values
+        :arg block_size: number of samples per block
+        :arg max_latency: maximum time in seconds between the arrival of a
+            sample and the callback, a block can then be shorter
+        """
+        # float holds the raw values exactly, so raw can be changed later
+        dtype = bool if self.type == DIGITAL else float
+        self.unregister_block_callback()
+        self.block_callback = BlockCallback(_callback, block_size, max_latency, dtype)
+        self.board._block_callbacks = self.board._block_callbacks + (self.block_callback,)
+
+    def unregister_block_callback(self):
+        """
+        Unregisters the block callback of the pin, samples which have not
+        been handed over yet are discarded
+        """
+        if self.block_callback is not None:
+            self.board._block_callbacks = tuple(
+                b for b in self.board._block_callbacks if b is not self.block_callback)
+            self.block_callback = None
+
     def write(self, value):
         """
         Output a voltage from the pin
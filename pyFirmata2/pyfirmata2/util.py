@@ -1,12 +1,18 @@
 from __future__ import division, unicode_literals
 
 import os
+import select
 import sys
 import threading
 import time
 
 import serial
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from .boards import BOARDS
 
 
@@ -39,18 +45,65 @@ def get_the_board(
 
 
 class Iterator(threading.Thread):
-    def __init__(self, board):
+    """
+    Thread which reads and handles the data from the board. By default it
+    polls the serial port every millisecond. When ``event_driven`` is set
+    it waits on the serial port instead and wakes up only when data
+    arrives or after ``timeout`` seconds to check if it has been stopped.
+    The wait is shortened to the next deadline of the block callbacks.
+    On POSIX the port is waited on with select() so that its timeout is
+    never changed. Elsewhere a blocking read with the port's timeout is
+    used, which is only reconfigured when the deadline changes.
+    """
+    def __init__(self, board, event_driven=False, timeout=0.1):
         super(Iterator, self).__init__()
         self.board = board
         self.daemon = True
         self.running = False
+        self.event_driven = event_driven
+        self.timeout = timeout
+
+    def _fileno(self):
+        """File descriptor of the serial port if select() can wait on it."""
+        if os.name != 'posix':
+            return None
+        try:
+            return self.board.sp.fileno()
+        except (AttributeError, ValueError, serial.SerialException, OSError):
+            return None
+
+    def _timeout(self, deadline):
+        """Time to wait for data until the next block deadline."""
+        if deadline is None:
+            return self.timeout
+        return min(self.timeout, max(deadline - time.time(), 0))
 
     def run(self):
         self.running = True
+        fd = self._fileno() if self.event_driven else None
+        if self.event_driven and fd is None:
+            # read() returns at the latest after the timeout so that stop() works
+            self.board.sp.timeout = self.timeout
+        last_deadline = None
         while self.running:
             try:
+                if self.event_driven:
+                    deadline = self.board.next_block_deadline()
+                    if fd is not None:
+                        ready = select.select([fd], [], [], self._timeout(deadline))[0]
+                        if ready:
+                            self.board.iterate()
+                    else:
+                        if deadline != last_deadline:
+                            # reconfiguring the port is a system call: only per block
+                            self.board.sp.timeout = self._timeout(deadline)
+                            last_deadline = deadline
+                        self.board.iterate()
+                    self.board.check_block_callbacks()
+                    continue
                 while self.board.bytes_available():
                     self.board.iterate()
+                self.board.check_block_callbacks()
                 time.sleep(0.001)
             except (AttributeError, serial.SerialException, OSError):
                 # this way we can kill the thread by setting the board object
@@ -75,6 +128,53 @@ class Iterator(threading.Thread):
         self.running = False
 
 
+class BlockCallback(object):
+    """
+    Collects the samples of a pin with their arrival times in preallocated
+    NumPy arrays and hands them over as blocks. A block is handed over when
+    ``block_size`` samples are collected or ``max_latency`` seconds after
+    its first sample, whichever comes first. All methods are called from
+    the sampling thread.
+    """
+
+    def __init__(self, callback, block_size=None, max_latency=None, dtype=float):
+        if np is None:
+            raise ImportError("Block callbacks need numpy: pip install pyFirmata2[block]")
+        if block_size is None and max_latency is None:
+            raise ValueError("Either block_size or max_latency is needed")
+        self.callback = callback
+        self.block_size = block_size or 1024
+        self.max_latency = max_latency
+        self.timestamps = np.empty(self.block_size)
+        self.values = np.empty(self.block_size, dtype=dtype)
+        self.count = 0
+        self.deadline = None
+
+    def append(self, value):
+        t = time.time()
+        i = self.count
+        if i == 0 and self.max_latency is not None:
+            self.deadline = t + self.max_latency
+        self.timestamps[i] = t
+        self.values[i] = value
+        self.count = i + 1
+        if self.count == self.block_size or (self.deadline is not None and t >= self.deadline):
+            self.flush()
+
+    def check(self, now):
+        """Hands over the collected samples if the deadline has passed."""
+        if self.count and self.deadline is not None and now >= self.deadline:
+            self.flush()
+
+    def flush(self):
+        """Hands over the collected samples as (timestamps, values) copies."""
+        n = self.count
+        self.count = 0
+        self.deadline = None
+        if n:
+            self.callback(self.timestamps[:n].copy(), self.values[:n].copy())
+
+
 def to_two_bytes(integer):
     """
     Breaks an integer into two 7 bit bytes.
@@ -15,6 +15,7 @@ setup(
     packages=['pyfirmata2'],
     include_package_data=True,
     install_requires=['pyserial'],
+    extras_require={'block': ['numpy']},
     zip_safe=False,
     url='https://github.com/berndporr/pyFirmata2',
     classifiers=[
@@ -1,5 +1,9 @@
 from __future__ import division, unicode_literals
 
+import functools
+import os
+import threading
+import time
 import unittest
 from itertools import chain
 
@@ -9,7 +13,7 @@ import pyfirmata2
 from pyfirmata2 import mockup
 from pyfirmata2.boards import BOARDS
 from pyfirmata2.util import (
-    break_to_bytes, from_two_bytes, str_to_two_byte_iter, to_two_bytes, two_byte_iter_to_str
+    Iterator, break_to_bytes, from_two_bytes, str_to_two_byte_iter, to_two_bytes, two_byte_iter_to_str
 )
 
 
@@ -53,6 +57,18 @@ class TestBoardMessages(BoardBaseTest):
         self.board._handle_analog_message(3, 127, 7)
         self.assertEqual(self.board.analog[3].read(), 1.0)
 
+    def test_handle_analog_message_raw(self):
+        self.board.analog[3].reporting = True
+        self.board.analog[3].raw = True
+        self.board._handle_analog_message(3, 0x7F, 3)
+        self.assertEqual(self.board.analog[3].read(), 511)
+        self.board.analog[3].raw = False
+        for value in (0, 1, 511, 1023, 1500):
+            self.board._handle_analog_message(3, value % 128, value >> 7)
+            self.assertEqual(self.board.analog[3].read(), round(float(value) / 1023, 4))
+        board = pyfirmata2.Board('', BOARDS['arduino'], raw_analog=True)
+        self.assertTrue(board.analog[0].raw)
+
     def test_handle_digital_message(self):
         # A digital message sets the value for a whole port. We will set pin
         # 5 (That is on port 0) to 1 to test if this is working.
@@ -298,6 +314,90 @@ class TestBoardMessages(BoardBaseTest):
             self.board.iterate()
         self.assertEqual(self.board.analog[4].read(), 1.0)
 
+    def test_partial_messages(self):
+        """
+        Messages which are split over several reads are completed by the
+        following calls of iterate.
+        """
+        self.board.analog[4].enable_reporting()
+        self.board.sp.clear()
+        msg = [pyfirmata2.ANALOG_MESSAGE + 4, 127, 7,
+               pyfirmata2.START_SYSEX, pyfirmata2.REPORT_FIRMWARE, 2, 1] + \
+            list(str_to_two_byte_iter('abc')) + [pyfirmata2.END_SYSEX]
+        for byte in msg[:-1]:
+            self.board.sp.write([byte])
+            self.board.iterate()
+        self.assertEqual(self.board.analog[4].read(), 1.0)
+        self.assertEqual(self.board.firmware, None)
+        self.board.sp.write(msg[-1:])
+        self.board.iterate()
+        self.assertEqual(self.board.firmware, 'abc')
+
+    def test_messages_in_one_read(self):
+        """
+        All waiting bytes are read and handled by one call of iterate.
+        """
+        values = []
+        self.board.analog[2].enable_reporting()
+        self.board.analog[2].register_callback(values.append)
+        self.board.sp.clear()
+        for value in (0, 1023, 512):
+            self.board.sp.write([pyfirmata2.ANALOG_MESSAGE + 2, value % 128, value >> 7])
+        self.board.iterate()
+        self.assertEqual(len(self.board.sp), 0)
+        self.assertEqual(values, [0.0, 1.0, round(512 / 1023, 4)])
+
+    def test_unknown_and_interrupted_messages(self):
+        """
+        Unknown sysex messages are skipped up to END_SYSEX and a status
+        byte in the middle of a message starts a new one.
+        """
+        self.board.analog[4].enable_reporting()
+        self.board.sp.clear()
+        self.board.sp.write([pyfirmata2.START_SYSEX, 0x01, 0x7F, 0x7F, pyfirmata2.END_SYSEX,
+                             pyfirmata2.ANALOG_MESSAGE + 4, 0,
+                             pyfirmata2.REPORT_VERSION, 2, 1,
+                             pyfirmata2.START_SYSEX, pyfirmata2.REPORT_FIRMWARE, 2,
+                             pyfirmata2.ANALOG_MESSAGE + 4, 127, 7])
+        self.board.iterate()
+        self.assertEqual(self.board.firmata_version, (2, 1))
+        self.assertEqual(self.board.firmware_version, None)
+        self.assertEqual(self.board.analog[4].read(), 1.0)
+
+    def test_invalid_pin(self):
+        """
+        A message for a pin which does not exist is dropped and the
+        following messages are still handled.
+        """
+        self.board.analog[4].enable_reporting()
+        self.board.sp.clear()
+        self.board.sp.write([pyfirmata2.ANALOG_MESSAGE + 15, 127, 7,
+                             pyfirmata2.ANALOG_MESSAGE + 4, 127, 7])
+        self.board.iterate()
+        self.assertEqual(self.board.analog[4].read(), 1.0)
+
+    def test_cmd_handler_dispatch(self):
+        """
+        Handlers are entered per board into the dispatch table for every
+        channel and get as many bytes as they have arguments.
+        """
+        received = []
+        self.board.add_cmd_handler(pyfirmata2.REPORT_ANALOG, lambda pin, enable: received.append((pin, enable)))
+        self.assertEqual(self.board._dispatch[pyfirmata2.REPORT_ANALOG + 5][1], 2)
+        self.assertEqual(self.board._dispatch[pyfirmata2.ANALOG_MESSAGE + 15][1], 3)
+        other = pyfirmata2.Board('', BOARDS['arduino'])
+        self.assertIsNone(other._dispatch[pyfirmata2.REPORT_ANALOG])
+        self.board.sp.clear()
+        self.board.sp.write([pyfirmata2.REPORT_ANALOG + 5, 1, pyfirmata2.REPORT_ANALOG + 3, 0])
+        self.board.iterate()
+        self.assertEqual(received, [(5, 1), (3, 0)])
+        # bound builtin methods and partials
+        self.board.add_cmd_handler(pyfirmata2.REPORT_DIGITAL, received.append)
+        self.assertEqual(self.board._dispatch[pyfirmata2.REPORT_DIGITAL][1], 1)
+        self.board.add_cmd_handler(pyfirmata2.REPORT_DIGITAL,
+                                   functools.partial(lambda a, b, c: None, 1))
+        self.assertEqual(self.board._dispatch[pyfirmata2.REPORT_DIGITAL][1], 2)
+
     # Servo config
     # --------------------
     # 0  START_SYSEX (0xF0)
@@ -470,6 +570,191 @@ class RegressionTests(BoardBaseTest):
             self.fail("exit() raised an AttributeError unexpectedly!")
 
 
+class IteratorTests(BoardBaseTest):
+
+    def run_iterator(self, iterator):
+        self.board.analog[4].enable_reporting()
+        self.board.sp.clear()
+        iterator.start()
+        self.board.sp.write([pyfirmata2.ANALOG_MESSAGE + 4, 127, 7])
+        t_end = time.time() + 1
+        while self.board.analog[4].value is None and time.time() < t_end:
+            time.sleep(0.001)
+        iterator.stop()
+        iterator.join(1)
+        self.assertFalse(iterator.is_alive())
+        self.assertEqual(self.board.analog[4].value, 1.0)
+
+    def test_polling(self):
+        self.run_iterator(Iterator(self.board))
+
+    def test_event_driven(self):
+        iterator = Iterator(self.board, event_driven=True, timeout=0.01)
+        self.run_iterator(iterator)
+        self.assertEqual(self.board.sp.timeout, 0.01)
+
+    def test_board_event_driven(self):
+        board = pyfirmata2.Board('', BOARDS['arduino'], event_driven=True)
+        self.assertTrue(board.samplerThread.event_driven)
+        self.assertFalse(self.board.samplerThread.event_driven)
+
+
+class BlockCallbackTests(BoardBaseTest):
+
+    def setUp(self):
+        super(BlockCallbackTests, self).setUp()
+        self.blocks = []
+        self.pin = self.board.analog[2]
+        self.pin.reporting = True
+
+    def callback(self, timestamps, values):
+        self.blocks.append((timestamps, values))
+
+    def send(self, values):
+        for value in values:
+            self.board._handle_analog_message(2, value % 128, value >> 7)
+
+    def test_block_size(self):
+        self.pin.raw = True
+        self.pin.register_block_callback(self.callback, block_size=3)
+        self.send(range(7))
+        self.assertEqual([list(v) for t, v in self.blocks], [[0, 1, 2], [3, 4, 5]])
+        # switching to normalised values after the registration
+        self.pin.raw = False
+        self.send([1023, 512])
+        self.assertEqual(list(self.blocks[2][1]), [6, 1.0, round(512 / 1023, 4)])
+        timestamps = self.blocks[1][0]
+        self.assertEqual(len(timestamps), 3)
+        self.assertTrue(all(timestamps[1:] >= timestamps[:-1]))
+
+    def test_max_latency(self):
+        self.pin.register_block_callback(self.callback, max_latency=0.01)
+        self.send([1023])
+        self.board.check_block_callbacks()
+        self.assertEqual(self.blocks, [])
+        time.sleep(0.02)
+        self.board.check_block_callbacks()
+        self.assertEqual(len(self.blocks), 1)
+        self.assertEqual(list(self.blocks[0][1]), [1.0])
+
+    def run_event_driven(self, sp):
+        """
+        Sends three samples to an event driven Iterator and returns the
+        time until their block arrives which must not wait for the
+        Iterator's timeout when no more data arrives.
+        """
+        self.board.sp = sp
+        self.pin.register_block_callback(self.callback, block_size=100, max_latency=0.02)
+        iterator = Iterator(self.board, event_driven=True, timeout=1)
+        iterator.start()
+        time.sleep(0.05)
+        t_sent = time.time()
+        for value in (1, 2, 3):
+            sp.write([pyfirmata2.ANALOG_MESSAGE + 2, value, 0])
+            time.sleep(0.002)
+        t_end = t_sent + 0.5
+        while not self.blocks and time.time() < t_end:
+            time.sleep(0.001)
+        t_received = time.time()
+        iterator.stop()
+        iterator.join(2)
+        self.assertEqual(len(self.blocks), 1)
+        self.assertEqual(len(self.blocks[0][1]), 3)
+        self.assertLess(t_received - t_sent, 0.2)
+
+    def test_max_latency_event_driven(self):
+        """
+        Without select() the read timeout of the port is only changed
+        when the deadline changes and not for every read.
+        """
+        class BlockingSerial(mockup.MockupSerial):
+            # read() waits until data is written or the timeout passes
+            arrived = threading.Event()
+            timeout_changes = 0
+            _timeout = None
+
+            @property
+            def timeout(self):
+                return self._timeout
+
+            @timeout.setter
+            def timeout(self, value):
+                self.timeout_changes += 1
+                self._timeout = value
+
+            def read(self, count=1):
+                if not len(self):
+                    self.arrived.wait(self._timeout)
+                self.arrived.clear()
+                return super(BlockingSerial, self).read(count)
+
+            def write(self, value):
+                super(BlockingSerial, self).write(value)
+                self.arrived.set()
+
+        sp = BlockingSerial('', 57600)
+        self.run_event_driven(sp)
+        # the initial timeout, the deadline of the block and back
+        self.assertLessEqual(sp.timeout_changes, 3)
+
+    @unittest.skipUnless(os.name == 'posix', "select() on file descriptors")
+    def test_max_latency_select(self):
+        """
+        On POSIX the Iterator waits with select() and leaves the port's
+        timeout alone.
+        """
+        import fcntl
+        import struct
+        import termios
+
+        class PipeSerial(object):
+            def __init__(self):
+                self.r, self.w = os.pipe()
+
+            def __setattr__(self, name, value):
+                if name == 'timeout':
+                    raise AssertionError("The timeout of the port was changed")
+                object.__setattr__(self, name, value)
+
+            def fileno(self):
+                return self.r
+
+            def inWaiting(self):
+                return struct.unpack('I', fcntl.ioctl(self.r, termios.FIONREAD, b'\0' * 4))[0]
+
+            def read(self, count=1):
+                return os.read(self.r, count)
+
+            def write(self, value):
+                os.write(self.w, bytes(bytearray(value)))
+
+            def close(self):
+                if self.r is not None:
+                    os.close(self.r)
+                    os.close(self.w)
+                    self.r = self.w = None
+
+        sp = PipeSerial()
+        self.run_event_driven(sp)
+        sp.close()
+
+    def test_unregister(self):
+        self.pin.register_block_callback(self.callback, block_size=2)
+        self.assertEqual(len(self.board._block_callbacks), 1)
+        self.pin.unregister_block_callback()
+        self.assertEqual(self.board._block_callbacks, ())
+        self.send([1, 2])
+        self.assertEqual(self.blocks, [])
+        self.assertRaises(ValueError, self.pin.register_block_callback, self.callback)
+
+    def test_digital(self):
+        self.board.digital[9].mode = pyfirmata2.INPUT
+        self.board.digital[9].register_block_callback(self.callback, block_size=2)
+        self.board._handle_digital_message(1, 2, 0)
+        self.board._handle_digital_message(1, 0, 0)
+        self.assertEqual([list(v) for t, v in self.blocks], [[True, False]])
+
+
 class UtilTests(unittest.TestCase):
 
     def test_to_two_bytes(self):
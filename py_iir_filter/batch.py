@@ -0,0 +1,160 @@
+#
+# Batch filtering of many recordings on all cores
+#
+# Usage: python batch.py [-o outdir] [--workers N] recordings_or_directories...
+#
+import argparse
+import collections
+import concurrent.futures
+import glob
+import itertools
+import os
+import time
+import unittest
+import numpy as np
+try:
+    from . import iir_filter
+    from . import design_cache
+except ImportError:
+    import iir_filter
+    import design_cache
+
+
+def example_cascade(fs=1000.0):
+    """The band-stop and low-pass chain of example.py"""
+    return [design_cache.butter(4, [48.0, 52.0], 'bandstop', fs=fs),
+            design_cache.butter(4, 100.0, fs=fs)]
+
+
+def filter_file(src, dst, cascade, column=1, chunk_size=65536):
+    """Streams a text recording through a filter cascade
+    src -- text file with one sample per row
+    dst -- output file, the same as src but with a filtered column
+    cascade -- list of sos arrays which are applied in turn
+    column -- column which is filtered
+    chunk_size -- number of rows processed at a time
+    returns a dict with the file, number of samples, time and worker
+    """
+    t0 = time.perf_counter()
+    filters = [iir_filter.IIR_filter(sos) for sos in cascade]
+    n = 0
+    with open(src) as fin, open(dst, 'w') as fout:
+        while True:
+            lines = list(itertools.islice(fin, chunk_size))
+            if not lines:
+                break
+            # chunks of only comments or blank lines have no data
+            if not any(line.split('#', 1)[0].strip() for line in lines):
+                continue
+            data = np.loadtxt(lines, ndmin=2)
+            y = data[:, column]
+            for f in filters:
+                y = f.filter_block(y)
+            data[:, column] = y
+            np.savetxt(fout, data, fmt='%.10g')
+            n += len(data)
+    return {'file': src, 'samples': n, 'seconds': time.perf_counter() - t0, 'worker': os.getpid()}
+
+
+def filter_files(paths, outdir, cascade, workers=None, suffix='_filtered', **kwargs):
+    """Filters many recordings in parallel with a process pool
+    paths -- recordings
+    outdir -- directory for the filtered recordings
+    cascade -- list of sos arrays which are applied in turn
+    workers -- number of processes, defaults to the number of cores
+    suffix -- appended to the base name of each output file
+    kwargs -- passed on to filter_file()
+    returns the list of per-file results and a dict of per-worker
+    totals (files, samples, seconds, samples_per_second)
+    """
+    os.makedirs(outdir, exist_ok=True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for p in paths:
+            base, ext = os.path.splitext(os.path.basename(p))
+            dst = os.path.join(outdir, base + suffix + ext)
+            futures.append(pool.submit(filter_file, p, dst, cascade, **kwargs))
+        results = [f.result() for f in futures]
+    workers = collections.defaultdict(lambda: {'files': 0, 'samples': 0, 'seconds': 0.0})
+    for r in results:
+        w = workers[r['worker']]
+        w['files'] += 1
+        w['samples'] += r['samples']
+        w['seconds'] += r['seconds']
+    for w in workers.values():
+        w['samples_per_second'] = w['samples'] / w['seconds'] if w['seconds'] else 0.0
+    return results, dict(workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Filters recordings with the band-stop and low-pass chain of example.py")
+    parser.add_argument('inputs', nargs='+', help="recordings or directories of .dat recordings")
+    parser.add_argument('-o', '--outdir', default='filtered', help="output directory")
+    parser.add_argument('--fs', type=float, default=1000.0, help="sampling rate")
+    parser.add_argument('--workers', type=int, default=None, help="number of processes")
+    parser.add_argument('--column', type=int, default=1, help="column to filter")
+    parser.add_argument('--chunk-size', type=int, default=65536, help="rows per chunk")
+    args = parser.parse_args(argv)
+    paths = []
+    for i in args.inputs:
+        paths += sorted(glob.glob(os.path.join(i, '*.dat'))) if os.path.isdir(i) else [i]
+    t0 = time.perf_counter()
+    results, workers = filter_files(paths, args.outdir, example_cascade(args.fs), args.workers,
+                                    column=args.column, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - t0
+    for r in results:
+        print("{file}: {samples} samples in {seconds:.3f} sec (worker {worker})".format(**r))
+    for pid, w in sorted(workers.items()):
+        print("worker {}: {} files, {} samples, {:.0f} samples/sec".format(
+            pid, w['files'], w['samples'], w['samples_per_second']))
+    total = sum(r['samples'] for r in results)
+    print("total: {} files, {} samples in {:.3f} sec, {:.0f} samples/sec".format(
+        len(results), total, elapsed, total / elapsed if elapsed else 0.0))
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_filter_files(self):
+        import tempfile
+        cascade = example_cascade()
+        rng = np.random.default_rng(7)
+        with tempfile.TemporaryDirectory() as path:
+            data = []
+            for i in range(3):
+                d = np.column_stack((np.arange(300), rng.integers(0, 4096, 300)))
+                np.savetxt(os.path.join(path, 'r{}.dat'.format(i)), d, fmt='%d')
+                data.append(d)
+            paths = [os.path.join(path, 'r{}.dat'.format(i)) for i in range(3)]
+            results, workers = filter_files(paths, os.path.join(path, 'out'), cascade,
+                                            workers=2, chunk_size=128)
+            self.assertEqual(sum(w['samples'] for w in workers.values()), 900)
+            for d, r in zip(data, results):
+                self.assertEqual(r['samples'], 300)
+                y = d[:, 1].astype(float)
+                for sos in cascade:
+                    y = iir_filter.IIR_filter(sos).filter_block(y)
+                out = np.loadtxt(os.path.join(path, 'out', os.path.basename(r['file']).replace('.dat', '_filtered.dat')))
+                np.testing.assert_array_equal(out[:, 0], d[:, 0])
+                np.testing.assert_allclose(out[:, 1], y, rtol=1e-8, atol=1e-8)
+
+    def test_comments(self):
+        import tempfile
+        cascade = example_cascade()
+        d = np.column_stack((np.arange(8), np.arange(8) % 3))
+        with tempfile.TemporaryDirectory() as path:
+            src = os.path.join(path, 'r.dat')
+            dst = os.path.join(path, 'o.dat')
+            with open(src, 'w') as f:
+                f.write('# t x\n# header\n')
+                np.savetxt(f, d, fmt='%d')
+                f.write('\n')
+            r = filter_file(src, dst, cascade, chunk_size=2)
+            self.assertEqual(r['samples'], 8)
+            y = d[:, 1].astype(float)
+            for sos in cascade:
+                y = iir_filter.IIR_filter(sos).filter_block(y)
+            np.testing.assert_allclose(np.loadtxt(dst)[:, 1], y, rtol=1e-8, atol=1e-8)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#
+# Throughput and latency benchmarks of the filter implementations
+#
+# Usage: python benchmark.py [--orders 2 4 8] [--channels 1 16]
+#                            [--dtypes float64 float32] [--output results.json]
+#                            [--baseline baseline.json] [--threshold 0.2]
+#
+# With --baseline the results are compared against a stored run and the
+# exit code is 1 when the throughput of any case dropped by more than
+# the threshold.
+#
+import argparse
+import json
+import platform
+import sys
+import time
+import unittest
+import numpy as np
+import iir_filter
+from scipy import signal
+
+PATHS = ['scalar', 'compact', 'generated', 'block', 'bank', 'bank_block']
+
+
+def make_case(path, sos, channels, dtype, block_size):
+    """Returns a function which processes one call worth of data and
+    the number of samples it processes"""
+    rng = np.random.default_rng(0)
+    if path in ('scalar', 'compact', 'generated'):
+        f = {'scalar': lambda: iir_filter.IIR_filter(sos).filter,
+             'compact': lambda: iir_filter.IIR_filter_compact(sos, dtype=dtype).filter,
+             'generated': lambda: iir_filter.generate_filter(sos)}[path]()
+        v = float(rng.standard_normal())
+        return (lambda: f(v)), 1
+    if path == 'block':
+        f = iir_filter.IIR_filter(sos, dtype=dtype)
+        x = rng.standard_normal(block_size).astype(dtype)
+        return (lambda: f.filter_block(x)), block_size
+    bank = iir_filter.IIR_filter_bank(sos, channels, dtype=dtype)
+    if path == 'bank':
+        v = rng.standard_normal(channels).astype(dtype)
+        return (lambda: bank.filter(v)), channels
+    x = rng.standard_normal((block_size, channels)).astype(dtype)
+    return (lambda: bank.filter_block(x)), block_size * channels
+
+
+def run_case(call, samples, duration=0.2):
+    """Measures the throughput and the per-call latency"""
+    call()
+    latencies = []
+    t_end = time.perf_counter() + duration
+    t0 = time.perf_counter()
+    while True:
+        t = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t)
+        if t >= t_end:
+            break
+    elapsed = time.perf_counter() - t0
+    latencies = np.array(latencies) * 1E6
+    return {'calls': len(latencies),
+            'samples_per_second': len(latencies) * samples / elapsed,
+            'latency_us': {'median': float(np.median(latencies)),
+                           'p99': float(np.percentile(latencies, 99))}}
+
+
+def run(orders=(2, 4, 8), channels=(1, 16), dtypes=('float64', 'float32'),
+        paths=PATHS, block_size=1000, duration=0.2):
+    """Runs all combinations which make sense and returns the results"""
+    results = {}
+    for order in orders:
+        sos = signal.butter(order, 0.1, output='sos')
+        for path in paths:
+            for ch in channels:
+                # only the bank processes several channels at once
+                if (ch != 1) != path.startswith('bank'):
+                    continue
+                for dtype in dtypes:
+                    # the scalar paths calculate with python floats
+                    if path in ('scalar', 'generated') and dtype != 'float64':
+                        continue
+                    case = "{}/order{}/ch{}/{}".format(path, order, ch, dtype)
+                    call, samples = make_case(path, sos, ch, np.dtype(dtype), block_size)
+                    results[case] = run_case(call, samples, duration)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the cases whose throughput dropped by more than the
+    threshold (a fraction) against the baseline"""
+    regressions = []
+    for case, r in results.items():
+        if case in baseline:
+            before = baseline[case]['samples_per_second']
+            if r['samples_per_second'] < before * (1 - threshold):
+                regressions.append((case, before, r['samples_per_second']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of py_iir_filter")
+    parser.add_argument('--orders', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--dtypes', nargs='+', default=['float64', 'float32'])
+    parser.add_argument('--paths', nargs='+', default=PATHS, choices=PATHS)
+    parser.add_argument('--block-size', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=0.2, help="seconds per case")
+    parser.add_argument('--output', help="json file for the results")
+    parser.add_argument('--baseline', help="json file of a previous run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="maximum allowed relative drop of the throughput")
+    args = parser.parse_args(argv)
+
+    results = run(args.orders, args.channels, args.dtypes, args.paths,
+                  args.block_size, args.duration)
+    for case, r in results.items():
+        print("{:36s} {:12.0f} samples/sec  median {:8.2f} us  p99 {:8.2f} us".format(
+            case, r['samples_per_second'], r['latency_us']['median'], r['latency_us']['p99']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'numpy': np.__version__,
+                       'machine': platform.machine(), 'block_size': args.block_size,
+                       'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for case, before, after in regressions:
+            print("REGRESSION {}: {:.0f} -> {:.0f} samples/sec".format(case, before, after))
+        if regressions:
+            return 1
+    return 0
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        results = run(orders=[2], channels=[1, 4], dtypes=['float32'], block_size=10, duration=0.001)
+        self.assertEqual(sorted(results), ['bank/order2/ch4/float32', 'bank_block/order2/ch4/float32',
+                                           'block/order2/ch1/float32', 'compact/order2/ch1/float32'])
+        slower = {case: {'samples_per_second': r['samples_per_second'] / 2} for case, r in results.items()}
+        faster = {case: {'samples_per_second': r['samples_per_second'] * 2} for case, r in results.items()}
+        self.assertEqual(compare(results, slower, 0.2), [])
+        self.assertEqual(len(compare(results, faster, 0.2)), 4)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#
+# Streaming decimators which combine an anti-alias filter with downsampling
+#
+import unittest
+import numpy as np
+try:
+    from . import iir_filter
+    from . import design_cache
+except ImportError:
+    import iir_filter
+    import design_cache
+
+
+class Decimator:
+    """Anti-alias filter and integer downsampling in one stage. The
+    first sample and then every factor-th sample is kept, also across
+    blocks so that blocks of any size and single samples can be mixed.
+
+    method 'iir' -- IIR_filter with the given sos (default: 8th order
+                    Chebyshev type I at 0.8 of the new Nyquist rate)
+    method 'fir' -- FIR filter in polyphase form: the output is only
+                    computed for the samples which are kept
+    method 'cic' -- cascaded integrator-comb filter which only needs
+                    integer additions; the integrators run at the input
+                    rate, the combs only for the kept samples. The
+                    input is quantised with the given scale, scale=1
+                    processes raw integer counts exactly.
+    """
+
+    def __init__(self, factor, sos=None, method='iir', taps=None, stages=3, scale=2 ** 24):
+        """Instantiates a decimator
+        factor -- integer downsampling factor
+        sos -- anti-alias filter for the 'iir' method
+        method -- 'iir', 'fir' or 'cic'
+        taps -- FIR coefficients for the 'fir' method
+        stages -- number of integrator-comb stages for the 'cic' method
+        scale -- the input of the 'cic' method is rounded to multiples
+                 of 1 / scale (an integer), 1 for raw integer counts
+        """
+        if int(factor) != factor or factor < 1:
+            raise ValueError("The decimation factor must be a positive integer")
+        self.factor = int(factor)
+        self.method = method
+        # offset of the next kept sample in the next block
+        self.phase = 0
+        if method == 'iir':
+            if sos is None:
+                sos = design_cache.design('cheby1', 8, 0.8 / self.factor, rp=0.05)
+            self.iir = iir_filter.IIR_filter(sos)
+        elif method == 'fir':
+            if taps is None:
+                from scipy import signal
+                taps = signal.firwin(10 * self.factor + 1, 1 / self.factor)
+            self.taps = np.asarray(taps, dtype=float)[::-1].copy()
+            self.history = np.zeros(len(self.taps) - 1)
+        elif method == 'cic':
+            self.stages = stages
+            self.gain = self.factor ** stages
+            if int(scale) != scale or scale < 1:
+                raise ValueError("The scale must be a positive integer")
+            self.scale = int(scale)
+            self.integrators = np.zeros(stages, dtype=np.int64)
+            self.combs = np.zeros(stages, dtype=np.int64)
+        else:
+            raise ValueError("Unknown method {}".format(method))
+
+    def _keep(self, n):
+        """Indices of the kept samples in a block of n samples"""
+        kept = np.arange(self.phase, n, self.factor)
+        self.phase = (self.phase - n) % self.factor
+        return kept
+
+    def filter_block(self, x):
+        """Filters and decimates a block
+        x -- 1D numpy array of samples
+        returns the kept filtered samples
+        """
+        if self.method == 'iir':
+            x = self.iir.filter_block(x)
+            return x[self._keep(len(x))]
+        if self.method == 'fir':
+            x = np.asarray(x, dtype=float)
+            ext = np.concatenate((self.history, x))
+            if len(self.history):
+                self.history = ext[-len(self.history):]
+            windows = np.lib.stride_tricks.sliding_window_view(ext, len(self.taps))
+            return windows[self._keep(len(x))] @ self.taps
+        x = np.asarray(x)
+        if len(x) == 0:
+            return np.zeros(0)
+        # the integrators grow without bound: float sums would lose their
+        # precision but integers wrap around which is exact for a CIC filter
+        if x.dtype.kind in 'iub':
+            y = x.astype(np.int64) * self.scale
+        else:
+            y = np.round(x * self.scale).astype(np.int64)
+        for i in range(self.stages):
+            y = np.cumsum(y, dtype=y.dtype)
+            y += self.integrators[i]
+            self.integrators[i] = y[-1]
+        y = y[self._keep(len(x))]
+        for i in range(self.stages):
+            if len(y):
+                previous = np.concatenate((self.combs[i:i + 1], y[:-1]))
+                self.combs[i] = y[-1]
+                y = y - previous
+        return y / (self.gain * self.scale)
+
+    def filter(self, v):
+        """Sample by sample filtering
+        v -- scalar sample
+        returns the filtered sample if it is kept, otherwise None
+        """
+        if self.method == 'iir':
+            v = self.iir.filter(v)
+            keep = self.phase == 0
+            self.phase = (self.phase - 1) % self.factor
+            return v if keep else None
+        y = self.filter_block([v])
+        return y[0] if len(y) else None
+
+
+class TestDecimator(unittest.TestCase):
+
+    def split(self, d, x):
+        """Feeds x as a mix of blocks and single samples"""
+        y = list(d.filter_block(x[:17]))
+        for v in x[17:30]:
+            v = d.filter(v)
+            if v is not None:
+                y.append(v)
+        y += list(d.filter_block(x[30:31]))
+        y += list(d.filter_block(x[31:]))
+        return np.array(y)
+
+    def test_iir(self):
+        x = np.random.default_rng(11).standard_normal(200)
+        sos = design_cache.design('cheby1', 8, 0.8 / 5, rp=0.05)
+        y = iir_filter.IIR_filter(sos).filter_block(x)
+        np.testing.assert_allclose(self.split(Decimator(5), x), y[::5], atol=1e-12)
+
+    def test_fir(self):
+        from scipy import signal
+        x = np.random.default_rng(12).standard_normal(200)
+        taps = signal.firwin(21, 0.25)
+        np.testing.assert_allclose(self.split(Decimator(4, method='fir', taps=taps), x),
+                                   signal.lfilter(taps, 1, x)[::4], atol=1e-12)
+
+    def test_cic(self):
+        from scipy import signal
+        x = np.random.default_rng(13).integers(0, 1024, 200)
+        y = x.astype(float)
+        for i in range(3):
+            y = signal.lfilter(np.ones(4), 1, y)
+        np.testing.assert_allclose(self.split(Decimator(4, method='cic'), x), y[::4] / 64)
+
+    def test_cic_float(self):
+        d = Decimator(4, method='cic')
+        d.integrators[:] = np.iinfo(np.int64).max - 12345
+        np.testing.assert_allclose(self.split(d, np.full(200, 0.5))[3:], 0.5)
+        x = np.random.default_rng(13).random(200)
+        y = self.split(Decimator(4, method='cic'), x)
+        z = self.split(Decimator(4, method='cic', scale=1), np.round(x * 2 ** 24).astype(np.int64))
+        np.testing.assert_allclose(y, z / 2 ** 24)
+        # the scale does not depend on the type of the first sample
+        d = Decimator(2, method='cic')
+        y = [d.filter(v) for v in [0] + [0.4] * 20]
+        self.assertAlmostEqual(y[-1], 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
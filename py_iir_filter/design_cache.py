@@ -0,0 +1,145 @@
+#
+# Memoizing cache for IIR filter designs
+#
+import collections
+import hashlib
+import os
+import threading
+import unittest
+import numpy as np
+from scipy import signal
+
+_BTYPES = {
+    'low': 'lowpass', 'lp': 'lowpass', 'lowpass': 'lowpass',
+    'high': 'highpass', 'hp': 'highpass', 'highpass': 'highpass',
+    'bandpass': 'bandpass', 'bp': 'bandpass', 'band': 'bandpass', 'pass': 'bandpass',
+    'bandstop': 'bandstop', 'bs': 'bandstop', 'stop': 'bandstop',
+}
+
+
+class DesignCache:
+    """Cache of sos filter designs with LRU eviction and an
+    optional on-disk store"""
+
+    def __init__(self, maxsize=128, path=None):
+        """Instantiates a design cache
+        maxsize -- maximum number of designs kept in memory
+        path -- optional directory where designs are persisted
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._designs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def design(self, ftype, order, edges, btype='lowpass', fs=None, rp=None, rs=None):
+        """Returns the sos of an IIR design, designing it only once
+        ftype -- 'butter', 'cheby1', 'cheby2', 'ellip' or 'bessel'
+        order -- filter order
+        edges -- cutoff frequency or band edges
+        btype -- 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        fs -- sampling rate; edges are normalised to Nyquist if None
+        rp, rs -- passband ripple and stopband attenuation in dB
+        returns a read-only sos array
+        """
+        edges = tuple(float(e) for e in np.atleast_1d(edges))
+        key = (ftype, int(order), _BTYPES[btype], edges,
+               None if fs is None else float(fs), rp, rs)
+        with self._lock:
+            sos = self._designs.get(key)
+            if sos is not None:
+                self._designs.move_to_end(key)
+                self.hits += 1
+                return sos
+            self.misses += 1
+        sos = self._load(key)
+        if sos is None:
+            sos = signal.iirfilter(key[1], edges[0] if len(edges) == 1 else list(edges),
+                                   rp=rp, rs=rs, btype=key[2], ftype=ftype,
+                                   fs=key[4], output='sos')
+            self._save(key, sos)
+        sos.setflags(write=False)
+        with self._lock:
+            self._designs[key] = sos
+            while len(self._designs) > self.maxsize:
+                self._designs.popitem(last=False)
+        return sos
+
+    def butter(self, order, edges, btype='low', fs=None):
+        """Cached equivalent of signal.butter(..., output='sos')"""
+        return self.design('butter', order, edges, btype, fs)
+
+    def clear(self):
+        """Empties the in-memory cache"""
+        with self._lock:
+            self._designs.clear()
+
+    def _filename(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
+
+    def _load(self, key):
+        if not self.path:
+            return None
+        try:
+            return np.load(self._filename(key))
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, key, sos):
+        if not self.path:
+            return
+        # write to a temporary file first so that readers never see a partial file
+        filename = self._filename(key)
+        tmp = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, sos)
+        os.replace(tmp, filename)
+
+
+default_cache = DesignCache()
+
+
+def design(ftype, order, edges, btype='lowpass', fs=None, rp=None, rs=None):
+    """DesignCache.design() on the module's default cache"""
+    return default_cache.design(ftype, order, edges, btype, fs, rp, rs)
+
+
+def butter(order, edges, btype='low', fs=None):
+    """DesignCache.butter() on the module's default cache"""
+    return default_cache.butter(order, edges, btype, fs)
+
+
+class TestDesignCache(unittest.TestCase):
+
+    def test_memoize(self):
+        cache = DesignCache()
+        sos = cache.butter(4, [48, 52], 'bandstop', fs=1000)
+        np.testing.assert_allclose(sos, signal.butter(4, [48, 52], 'bandstop', fs=1000, output='sos'))
+        self.assertIs(sos, cache.butter(4, (48.0, 52.0), 'stop', fs=1000))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru(self):
+        cache = DesignCache(maxsize=2)
+        a = cache.butter(2, 0.1)
+        cache.butter(2, 0.2)
+        cache.butter(2, 0.1)
+        cache.butter(2, 0.3)
+        self.assertIs(a, cache.butter(2, 0.1))
+        self.assertEqual(cache.misses, 3)
+        cache.butter(2, 0.2)
+        self.assertEqual(cache.misses, 4)
+
+    def test_disk(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as path:
+            sos = DesignCache(path=path).design('cheby1', 3, 0.2, rp=1)
+            cache = DesignCache(path=path)
+            np.testing.assert_array_equal(sos, cache.design('cheby1', 3, 0.2, rp=1))
+            self.assertEqual(len(os.listdir(path)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import numpy as np
 import pylab as pl
 import iir_filter
-from scipy import signal
+import design_cache
+import recording
 #
-data = np.loadtxt('ecg_50hz_1.dat')
+data = recording.load_recording('ecg_50hz_1.dat')
 data = data - 2048
 data = data * 2E-3 * 500 / 1000
 fs = 1000.0
@@ -19,15 +20,13 @@ pl.ylabel('ECG/mV')
 #
 f0 = 48.0
 f1 = 52.0
-sos1 = signal.butter(4, [f0/fs*2,f1/fs*2], 'bandstop', output='sos')
+sos1 = design_cache.butter(4, [f0/fs*2,f1/fs*2], 'bandstop')
 f2 = 100
-sos2 = signal.butter(4, f2/fs*2, output='sos')
+sos2 = design_cache.butter(4, f2/fs*2)
 
 iir1 = iir_filter.IIR_filter(sos1)
 iir2 = iir_filter.IIR_filter(sos2)
-y2 = np.zeros(len(y))
-for i in range(len(y)):
-    y2[i] = iir1.filter(iir2.filter(y[i]))
+y2 = iir1.filter_block(iir2.filter_block(y))
 
 yf = np.fft.fft(y2) / len(y2)
 yf[0] = 0
@@ -0,0 +1,161 @@
+#
+# Fixed point IIR filter which operates on raw integer ADC counts
+#
+import unittest
+import numpy as np
+
+
+def quantize(sos, frac_bits=24, coeff_bits=32):
+    """Quantizes sos coefficients to signed Q format integers
+    sos -- array of 2nd order IIR filter coefficients
+    frac_bits -- number of fractional bits
+    coeff_bits -- total number of bits of a coefficient incl. sign
+    returns an (sections x 5) list of integers b0, b1, b2, a1, a2
+    """
+    limit = 1 << (coeff_bits - 1)
+    q = []
+    for s in sos:
+        c = [int(round(float(s[i]) * (1 << frac_bits))) for i in (0, 1, 2, 4, 5)]
+        if any(v >= limit or v < -limit for v in c):
+            raise ValueError("Coefficients of {} do not fit into Q{}.{}".format(
+                list(s), coeff_bits - frac_bits - 1, frac_bits))
+        q.append(c)
+    return q
+
+
+class IIR_filter_fixed:
+    """Fixed point IIR filter in direct form II. Only integer
+    arithmetic is used so that it can operate on raw ADC counts.
+    The states and the output saturate instead of wrapping around."""
+
+    def __init__(self, sos, frac_bits=24, coeff_bits=32, guard_bits=8, state_bits=32, output_bits=32):
+        """Instantiates a fixed point IIR filter of any order
+        sos -- array of 2nd order IIR filter coefficients
+        frac_bits -- fractional bits of the coefficients (Q format)
+        coeff_bits -- total bits of the coefficients incl. sign
+        guard_bits -- extra fractional bits of the states
+        state_bits -- width of the state registers
+        output_bits -- width of the output
+        """
+        self.coefficients = quantize(sos, frac_bits, coeff_bits)
+        self.frac_bits = frac_bits
+        self.guard_bits = guard_bits
+        self.state_bits = state_bits
+        self.output_bits = output_bits
+        self.state = [[0, 0] for s in self.coefficients]
+        self._state_limits = (-(1 << (state_bits - 1)), (1 << (state_bits - 1)) - 1)
+        self._output_limits = (-(1 << (output_bits - 1)), (1 << (output_bits - 1)) - 1)
+
+    def filter(self, v):
+        """Sample by sample filtering
+        v -- integer sample, for example raw ADC counts
+        returns filtered integer sample
+        """
+        f = self.frac_bits
+        half = 1 << (f - 1)
+        lo, hi = self._state_limits
+        v = int(v) << self.guard_bits
+        v = hi if v > hi else lo if v < lo else v
+        for (b0, b1, b2, a1, a2), s in zip(self.coefficients, self.state):
+            buffer1, buffer2 = s
+            input = ((v << f) - a1 * buffer1 - a2 * buffer2 + half) >> f
+            input = hi if input > hi else lo if input < lo else input
+            v = (b1 * buffer1 + b2 * buffer2 + b0 * input + half) >> f
+            v = hi if v > hi else lo if v < lo else v
+            s[1] = buffer1
+            s[0] = input
+        if self.guard_bits:
+            v = (v + (1 << (self.guard_bits - 1))) >> self.guard_bits
+        lo, hi = self._output_limits
+        return hi if v > hi else lo if v < lo else v
+
+    def filter_block(self, x):
+        """Filters a block of integer samples. The block is processed
+        section by section which gives the same result as filter().
+        x -- 1D array of integer samples
+        returns filtered int64 array
+        """
+        f = self.frac_bits
+        half = 1 << (f - 1)
+        g = self.guard_bits
+        lo, hi = self._state_limits
+        values = np.clip(np.asarray(x, dtype=np.int64) << g, lo, hi).tolist()
+        for (b0, b1, b2, a1, a2), s in zip(self.coefficients, self.state):
+            buffer1, buffer2 = s
+            out = []
+            append = out.append
+            for v in values:
+                input = ((v << f) - a1 * buffer1 - a2 * buffer2 + half) >> f
+                if input > hi:
+                    input = hi
+                elif input < lo:
+                    input = lo
+                v = (b1 * buffer1 + b2 * buffer2 + b0 * input + half) >> f
+                if v > hi:
+                    v = hi
+                elif v < lo:
+                    v = lo
+                append(v)
+                buffer2 = buffer1
+                buffer1 = input
+            s[0] = buffer1
+            s[1] = buffer2
+            values = out
+        y = np.array(values, dtype=np.int64)
+        if g:
+            y = (y + (1 << (g - 1))) >> g
+        return np.clip(y, *self._output_limits)
+
+
+class TestFixedPoint(unittest.TestCase):
+
+    sos = [[1.78260999e-03, 3.56521998e-03, 1.78260999e-03,
+            1.00000000e+00, -1.25544047e+00, 4.09013783e-01],
+           [1.00000000e+00, 2.00000000e+00, 1.00000000e+00,
+            1.00000000e+00, -1.51824184e+00, 7.03962657e-01]]
+
+    @staticmethod
+    def reference(sos, x, frac_bits, guard_bits):
+        """Independent int64 reference model without saturation"""
+        q = np.round(np.asarray(sos)[:, [0, 1, 2, 4, 5]] * 2 ** frac_bits).astype(np.int64)
+        w = np.zeros((len(q), 2), dtype=np.int64)
+        y = []
+        for v in x:
+            v = np.int64(v) * 2 ** guard_bits
+            for k, (b0, b1, b2, a1, a2) in enumerate(q):
+                acc = v * 2 ** frac_bits - a1 * w[k, 0] - a2 * w[k, 1]
+                wn = (acc + 2 ** (frac_bits - 1)) // 2 ** frac_bits
+                acc = b1 * w[k, 0] + b2 * w[k, 1] + b0 * wn
+                v = (acc + 2 ** (frac_bits - 1)) // 2 ** frac_bits
+                w[k] = wn, w[k, 0]
+            y.append((v + 2 ** (guard_bits - 1)) // 2 ** guard_bits)
+        return y
+
+    def test_bit_exact(self):
+        x = np.random.default_rng(8).integers(0, 1024, 500)
+        f = IIR_filter_fixed(self.sos, frac_bits=20, guard_bits=6)
+        self.assertEqual(list(f.filter_block(x)), self.reference(self.sos, x, 20, 6))
+        f = IIR_filter_fixed(self.sos, frac_bits=20, guard_bits=6)
+        self.assertEqual([f.filter(v) for v in x[:200]] + list(f.filter_block(x[200:])),
+                         self.reference(self.sos, x, 20, 6))
+
+    def test_float(self):
+        import iir_filter
+        x = np.random.default_rng(9).integers(0, 1024, 500)
+        y = iir_filter.IIR_filter(self.sos).filter_block(x)
+        np.testing.assert_allclose(IIR_filter_fixed(self.sos).filter_block(x), y, atol=1)
+
+    def test_saturation(self):
+        f = IIR_filter_fixed(self.sos, output_bits=10)
+        y = f.filter_block([1023] * 200)
+        self.assertEqual(y.max(), 511)
+        # saturating states give the same result sample by sample and in blocks
+        f = IIR_filter_fixed(self.sos, state_bits=20)
+        y = [f.filter(1023) for i in range(50)]
+        self.assertEqual(list(IIR_filter_fixed(self.sos, state_bits=20).filter_block([1023] * 50)), y)
+        self.assertLess(max(y), 1023)
+        self.assertRaises(ValueError, IIR_filter_fixed, self.sos, coeff_bits=16, frac_bits=14)
+
+
+if __name__ == '__main__':
+    unittest.main()
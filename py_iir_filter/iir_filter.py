@@ -2,8 +2,48 @@
 # (C) 2020-2021 Bernd Porr, mail@berndporr.me.uk
 # Apache 2.0 license
 #
+import array
+import functools
 import numpy as np
 import unittest
+try:
+    from scipy.signal import lfilter, sos2zpk, zpk2sos
+except ImportError:
+    lfilter = None
+
+# typecodes of the array.array storage of the compact filter
+_TYPECODES = {np.dtype(np.float64): 'd', np.dtype(np.float32): 'f'}
+
+
+def _as_float(x):
+    """Returns x as a float32 or float64 array without copying it
+    if it already is one"""
+    x = np.asarray(x)
+    if x.dtype in _TYPECODES:
+        return x
+    return x.astype(float)
+
+
+def _df2_block(b0,b1,b2,a1,a2,x,w1,w2):
+    """Direct form II biquad over a whole block (along axis 0)
+    x -- input block
+    w1, w2 -- delayed internal states (scalars or one per channel)
+    returns the filtered block and the new states w1, w2
+    """
+    # the recursive part is an all-pole filter which lfilter runs in C;
+    # its transposed states are derived from the direct form II states
+    dtype = x.dtype
+    a1 = dtype.type(a1)
+    a2 = dtype.type(a2)
+    zi = np.array([-a1 * w1 - a2 * w2, -a2 * w1],dtype=dtype)
+    w,_ = lfilter(np.ones(1,dtype),np.array([1,a1,a2],dtype),x,axis=0,zi=zi)
+    # the non-recursive part is a short FIR over the delayed states
+    w = np.concatenate((np.asarray([w2,w1],dtype=dtype),w))
+    b0 = dtype.type(b0)
+    b1 = dtype.type(b1)
+    b2 = dtype.type(b2)
+    y = b0 * w[2:] + b1 * w[1:-1] + b2 * w[:-2]
+    return y,w[-1],w[-2]
 
 class IIR2_filter:
     """2nd order IIR filter"""
@@ -31,12 +71,46 @@ class IIR2_filter:
         self.buffer1 = input
         return output
 
+    def set_steady_state(self,v):
+        """Sets the state to the steady state for a constant input
+        so that there is no warm-up transient
+        v -- input value
+        returns the steady state output
+        """
+        w = v / (1 + self.denominator1 + self.denominator2)
+        self.buffer1 = w
+        self.buffer2 = w
+        return (self.numerator0 + self.numerator1 + self.numerator2) * w
+
+    def filter_block(self,x):
+        """Block filtering which shares its state with filter()
+        x -- 1D numpy array of samples, float32 arrays are
+             processed in single precision
+        returns filtered array
+        """
+        x = _as_float(x)
+        if len(x) == 0:
+            return x.copy()
+        if lfilter is None:
+            return np.array([self.filter(v) for v in x],dtype=x.dtype)
+        y,w1,w2 = _df2_block(self.numerator0,self.numerator1,self.numerator2,
+                             self.denominator1,self.denominator2,
+                             x,self.buffer1,self.buffer2)
+        self.buffer1 = float(w1)
+        self.buffer2 = float(w2)
+        return y
+
 class IIR_filter:
     """IIR filter"""
-    def __init__(self,sos):
+    def __init__(self,sos,dtype=np.float64):
         """Instantiates an IIR filter of any order
         sos -- array of 2nd order IIR filter coefficients
+        dtype -- precision of the block filtering, with float32 the
+                 sections are paired and ordered for stability
         """
+        self.dtype = np.dtype(dtype)
+        if self.dtype != np.float64:
+            sos = order_sections(sos)
         self.cascade = []
         for s in sos:
             self.cascade.append(IIR2_filter(s))
@@ -50,6 +124,311 @@ class IIR_filter:
             v = f.filter(v)
         return v
 
+    def set_steady_state(self,v):
+        """Sets all sections to the steady state for a constant input,
+        in the manner of scipy's lfilter_zi, to avoid warm-up transients
+        v -- input value, for example the first sample
+        """
+        for f in self.cascade:
+            v = f.set_steady_state(v)
+
+    def filter_block(self,x):
+        """Block filtering of a whole array in one call. The state
+        is shared with filter() so that both can be mixed on one stream.
+        x -- 1D numpy array of samples
+        returns filtered array
+        """
+        x = np.asarray(x,dtype=self.dtype)
+        for f in self.cascade:
+            x = f.filter_block(x)
+        return x
+
+    def stream(self,iterable,chunk_size=1024):
+        """Lazy filtering of a stream in constant memory. The state is
+        carried across chunks.
+        iterable -- samples and/or blocks of samples
+        chunk_size -- number of samples per yielded chunk
+        yields filtered chunks as numpy arrays
+        """
+        for chunk in _rechunk(iterable,chunk_size):
+            yield self.filter_block(chunk)
+
+def _rechunk(iterable,chunk_size):
+    """Regroups an iterable of samples and/or blocks lazily into
+    arrays of chunk_size samples (the last one may be shorter).
+    The yielded arrays are only valid until the next one is requested.
+    """
+    buffer = np.empty(chunk_size)
+    n = 0
+    for item in iterable:
+        if np.ndim(item) == 0:
+            buffer[n] = item
+            n += 1
+            if n == chunk_size:
+                yield buffer
+                n = 0
+            continue
+        item = np.asarray(item,dtype=float)
+        i = 0
+        while i < len(item):
+            if n == 0 and len(item) - i >= chunk_size:
+                # whole chunks are passed on without copying
+                yield item[i:i+chunk_size]
+                i += chunk_size
+                continue
+            k = min(chunk_size - n,len(item) - i)
+            buffer[n:n+k] = item[i:i+k]
+            n += k
+            i += k
+            if n == chunk_size:
+                yield buffer
+                n = 0
+    if n:
+        yield buffer[:n]
+
+
+@functools.lru_cache(maxsize=None)
+def _section_offsets(n):
+    """Offsets into the coefficient and state arrays of n sections,
+    shared by all compact filters of the same order"""
+    return tuple((5 * i,2 * i) for i in range(n))
+
+
+class IIR_filter_compact:
+    """Compact IIR filter which keeps all coefficients and states
+    in two contiguous arrays. Drop-in replacement for IIR_filter."""
+    __slots__ = ('coefficients','state')
+
+    def __init__(self,sos,dtype=np.float64):
+        """Instantiates an IIR filter of any order
+        sos -- array of 2nd order IIR filter coefficients
+        dtype -- precision of the coefficients and states, with float32
+                 the sections are paired and ordered for stability
+        """
+        dtype = np.dtype(dtype)
+        if dtype != np.float64:
+            sos = order_sections(sos)
+        typecode = _TYPECODES[dtype]
+        self.coefficients = array.array(typecode)
+        for s in sos:
+            self.coefficients.extend((s[0],s[1],s[2],s[4],s[5]))
+        self.state = array.array(typecode,bytes(2 * dtype.itemsize * len(sos)))
+
+    def filter(self,v):
+        """Sample by sample filtering
+        v -- scalar sample
+        returns filtered sample
+        """
+        c = self.coefficients
+        s = self.state
+        for i,j in _section_offsets(len(s) >> 1):
+            buffer1 = s[j]
+            buffer2 = s[j+1]
+            input = v - (c[i+3] * buffer1) - (c[i+4] * buffer2)
+            v = (c[i+1] * buffer1) + (c[i+2] * buffer2) + input * c[i]
+            s[j+1] = buffer1
+            s[j] = input
+        return v
+
+    def set_steady_state(self,v):
+        """Sets all sections to the steady state for a constant input
+        v -- input value, for example the first sample
+        """
+        c = self.coefficients
+        s = self.state
+        for i,j in _section_offsets(len(s) >> 1):
+            w = v / (1 + c[i+3] + c[i+4])
+            s[j] = w
+            s[j+1] = w
+            v = (c[i] + c[i+1] + c[i+2]) * w
+
+    def filter_block(self,x):
+        """Block filtering which shares its state with filter()
+        x -- 1D numpy array of samples
+        returns filtered array
+        """
+        dtype = np.dtype(self.state.typecode)
+        x = np.asarray(x,dtype=dtype)
+        if len(x) == 0:
+            return x.copy()
+        if lfilter is None:
+            return np.array([self.filter(v) for v in x],dtype=dtype)
+        # zero copy views of the arrays
+        c = np.frombuffer(self.coefficients,dtype=dtype).reshape(-1,5)
+        s = np.frombuffer(self.state,dtype=dtype).reshape(-1,2)
+        for i in range(len(c)):
+            x,s[i,0],s[i,1] = _df2_block(c[i,0],c[i,1],c[i,2],c[i,3],c[i,4],
+                                         x,s[i,0],s[i,1])
+        return x
+
+    def stream(self,iterable,chunk_size=1024):
+        """Lazy filtering of a stream in constant memory. The state is
+        carried across chunks.
+        iterable -- samples and/or blocks of samples
+        chunk_size -- number of samples per yielded chunk
+        yields filtered chunks as numpy arrays
+        """
+        for chunk in _rechunk(iterable,chunk_size):
+            yield self.filter_block(chunk)
+
+
+class IIR_filter_bank:
+    """IIR filter bank which applies one design to many channels"""
+    def __init__(self,sos,channels,dtype=np.float64):
+        """Instantiates an IIR filter for a number of channels
+        sos -- array of 2nd order IIR filter coefficients
+        channels -- number of channels
+        dtype -- precision of the coefficients and states, with float32
+                 the sections are paired and ordered for stability
+        """
+        dtype = np.dtype(dtype)
+        if dtype != np.float64:
+            sos = order_sections(sos)
+        sos = np.asarray(sos,dtype=dtype)
+        self.numerator0 = sos[:,0]
+        self.numerator1 = sos[:,1]
+        self.numerator2 = sos[:,2]
+        self.denominator1 = sos[:,4]
+        self.denominator2 = sos[:,5]
+        # (channels x sections x 2): both delay lines of every section
+        self.state = np.zeros((channels,len(sos),2),dtype=dtype)
+
+    def filter(self,v):
+        """Frame by frame filtering
+        v -- vector with one sample per channel
+        returns filtered vector
+        """
+        s = self.state
+        v = np.asarray(v,dtype=s.dtype)
+        for i in range(s.shape[1]):
+            buffer1 = s[:,i,0]
+            buffer2 = s[:,i,1]
+            input = v - (self.denominator1[i] * buffer1) - (self.denominator2[i] * buffer2)
+            v = (self.numerator1[i] * buffer1) + (self.numerator2[i] * buffer2) + input * self.numerator0[i]
+            s[:,i,1] = buffer1
+            s[:,i,0] = input
+        return v
+
+    def set_steady_state(self,v):
+        """Sets all sections to the steady state for a constant input
+        v -- input value for all channels or one per channel
+        """
+        s = self.state
+        v = np.asarray(v,dtype=s.dtype)
+        for i in range(s.shape[1]):
+            w = v / (1 + self.denominator1[i] + self.denominator2[i])
+            s[:,i,0] = w
+            s[:,i,1] = w
+            v = (self.numerator0[i] + self.numerator1[i] + self.numerator2[i]) * w
+
+    def filter_block(self,x):
+        """Block filtering which shares its state with filter()
+        x -- (samples x channels) array
+        returns filtered array
+        """
+        s = self.state
+        x = np.asarray(x,dtype=s.dtype)
+        if len(x) == 0:
+            return x.copy()
+        if lfilter is None:
+            return np.array([self.filter(v) for v in x],dtype=s.dtype)
+        for i in range(s.shape[1]):
+            x,s[:,i,0],s[:,i,1] = _df2_block(self.numerator0[i],self.numerator1[i],
+                                             self.numerator2[i],self.denominator1[i],
+                                             self.denominator2[i],x,s[:,i,0],s[:,i,1])
+        return x
+
+
+def order_sections(sos):
+    """Pairs the poles and zeros of a design into sections with the
+    poles closest to the unit circle last which keeps single precision
+    cascades stable. Needs scipy, otherwise sos is returned unchanged.
+    sos -- array of 2nd order IIR filter coefficients
+    returns the reordered sos
+    """
+    if lfilter is None:
+        return sos
+    z,p,k = sos2zpk(np.asarray(sos,dtype=float))
+    return zpk2sos(z,p,k,pairing='nearest')
+
+
+def precision_error(sos,dtype=np.float32,x=None):
+    """Error of block filtering at a lower precision against float64
+    sos -- array of 2nd order IIR filter coefficients
+    dtype -- precision under test
+    x -- test signal, white noise plus a few sines by default
+    returns a dict with the max absolute error, the rms error and
+    the signal to error ratio in dB
+    """
+    if x is None:
+        t = np.arange(10000)
+        x = np.random.default_rng(0).standard_normal(len(t))
+        for f in (0.01,0.05,0.2):
+            x += np.sin(2 * np.pi * f * t)
+    reference = IIR_filter(sos).filter_block(x)
+    y = IIR_filter(sos,dtype=dtype).filter_block(x).astype(float)
+    e = y - reference
+    rms = np.sqrt(np.mean(e ** 2))
+    return {'max_abs': float(np.max(np.abs(e))),
+            'rms': float(rms),
+            'snr_db': float(10 * np.log10(np.mean(reference ** 2) / rms ** 2)) if rms else np.inf}
+
+
+def generate_filter(sos,x0=None):
+    """Generates a specialised sample by sample filter function for
+    a fixed cascade. All sections are unrolled, the coefficients are
+    inlined as constants and the states are kept in closure variables.
+    sos -- array of 2nd order IIR filter coefficients
+    x0 -- optional input value for which the states start in steady state
+    returns a function which takes a scalar sample and returns the
+    filtered sample
+    """
+    def term(c,name):
+        c = float(c)
+        if c == 0:
+            return None
+        if c == 1:
+            return name
+        return "{!r} * {}".format(c,name)
+
+    states = []
+    body = []
+    for i,s in enumerate(sos):
+        buffer1 = "buffer1_{}".format(i)
+        buffer2 = "buffer2_{}".format(i)
+        states += [buffer1,buffer2]
+        input = "v"
+        for c,name in ((s[4],buffer1),(s[5],buffer2)):
+            t = term(c,name)
+            if t:
+                input += " - " + t
+        # same order of operations as IIR2_filter for identical results
+        output = [t for t in (term(s[1],buffer1),term(s[2],buffer2),term(s[0],"input")) if t]
+        body += ["        input = " + input,
+                 "        v = " + (" + ".join(output) or "0.0"),
+                 "        {} = {}".format(buffer2,buffer1),
+                 "        {} = input".format(buffer1)]
+    initial = [0.0] * len(states)
+    if x0 is not None:
+        f = IIR_filter(sos)
+        f.set_steady_state(x0)
+        initial = [b for s in f.cascade for b in (s.buffer1,s.buffer2)]
+    lines = ["def make():"]
+    lines += ["    {} = {!r}".format(b,float(w)) for b,w in zip(states,initial)]
+    lines += ["    def filter(v):"]
+    if states:
+        lines += ["        nonlocal " + ", ".join(states)]
+    lines += body
+    lines += ["        return v",
+              "    return filter"]
+    source = "\n".join(lines) + "\n"
+    namespace = {}
+    exec(compile(source,"<iir_filter {} sections>".format(len(sos)),"exec"),namespace)
+    f = namespace["make"]()
+    f.source = source
+    return f
+
+
 class TestFilters(unittest.TestCase):
 
     coeff1 = [
@@ -100,6 +479,89 @@ class TestFilters(unittest.TestCase):
         for i,r in zip(self.input1,self.result1):
             self.assertAlmostEqual(r,f.filter(i))
 
+    def test_block(self):
+        f = IIR_filter(self.coeff2)
+        y = f.filter_block(np.array(self.input2))
+        np.testing.assert_allclose(y,self.result2,atol=1e-7)
+
+    def test_block_mixed(self):
+        x = np.random.default_rng(1).standard_normal(100)
+        f1 = IIR_filter(self.coeff2)
+        f2 = IIR_filter(self.coeff2)
+        y1 = [f1.filter(v) for v in x]
+        y2 = np.concatenate((f2.filter_block(x[:1]),
+                             [f2.filter(v) for v in x[1:40]],
+                             f2.filter_block(x[40:]),
+                             f2.filter_block(x[:0])))
+        np.testing.assert_allclose(y1,y2,atol=1e-12)
+
+
+    def test_stream(self):
+        x = np.random.default_rng(4).standard_normal(100)
+        y = IIR_filter(self.coeff2).filter_block(x)
+        items = list(x[:5]) + [x[5:7],x[7:60]] + list(x[60:63]) + [x[63:]]
+        for f in (IIR_filter(self.coeff2),IIR_filter_compact(self.coeff2)):
+            chunks = list(f.stream(iter(items),chunk_size=16))
+            self.assertEqual([len(c) for c in chunks],[16] * 6 + [4])
+            np.testing.assert_allclose(np.concatenate(chunks),y,atol=1e-12)
+
+    def test_compact(self):
+        f = IIR_filter_compact(self.coeff2)
+        for i,r in zip(self.input2,self.result2):
+            self.assertAlmostEqual(r,f.filter(i))
+        f = IIR_filter_compact(self.coeff2)
+        y = np.concatenate(([f.filter(v) for v in self.input2[:3]],
+                            f.filter_block(self.input2[3:])))
+        np.testing.assert_allclose(y,self.result2,atol=1e-7)
+        self.assertFalse(hasattr(f,'__dict__'))
+
+    def test_generated(self):
+        f = generate_filter(self.coeff2)
+        for i,r in zip(self.input2,self.result2):
+            self.assertAlmostEqual(r,f(i))
+        x = np.random.default_rng(3).standard_normal(50)
+        f1 = IIR_filter(self.coeff2)
+        f2 = generate_filter(self.coeff2)
+        self.assertEqual([f1.filter(v) for v in x],[f2(v) for v in x])
+
+    def test_bank(self):
+        x = np.random.default_rng(2).standard_normal((50,3))
+        bank = IIR_filter_bank(self.coeff2,3)
+        y = np.concatenate((bank.filter_block(x[:20]),
+                            [bank.filter(v) for v in x[20:30]],
+                            bank.filter_block(x[30:])))
+        for c in range(3):
+            f = IIR_filter(self.coeff2)
+            np.testing.assert_allclose([f.filter(v) for v in x[:,c]],y[:,c],atol=1e-12)
+
+    def test_float32(self):
+        from scipy import signal
+        sos = signal.butter(8,[0.1,0.2],'bandpass',output='sos')
+        x = np.random.default_rng(10).standard_normal((300,2))
+        y = IIR_filter(sos).filter_block(x[:,0])
+        np.testing.assert_allclose(IIR_filter(order_sections(sos)).filter_block(x[:,0]),y,atol=1e-9)
+        for f in (IIR_filter(sos,dtype=np.float32),IIR_filter_compact(sos,dtype=np.float32)):
+            y32 = f.filter_block(x[:,0])
+            self.assertEqual(y32.dtype,np.float32)
+            np.testing.assert_allclose(y32,y,atol=1e-4)
+        bank = IIR_filter_bank(sos,2,dtype=np.float32)
+        self.assertEqual(bank.state.dtype,np.float32)
+        np.testing.assert_allclose(bank.filter_block(x)[:,0],y,atol=1e-4)
+        self.assertGreater(precision_error(sos)['snr_db'],80)
+
+    def test_steady_state(self):
+        x = np.full(20,0.7)
+        f = IIR_filter(self.coeff2)
+        f.set_steady_state(0.7)
+        np.testing.assert_allclose(f.filter_block(x),x,rtol=1e-6)
+        f = IIR_filter_compact(self.coeff2)
+        f.set_steady_state(0.7)
+        self.assertAlmostEqual(f.filter(0.7),0.7,places=6)
+        f = generate_filter(self.coeff2,x0=0.7)
+        self.assertAlmostEqual(f(0.7),0.7,places=6)
+        bank = IIR_filter_bank(self.coeff2,2)
+        bank.set_steady_state([0.7,-2])
+        np.testing.assert_allclose(bank.filter([0.7,-2]),[0.7,-2],rtol=1e-6)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,178 @@
+#
+# Parallel form (partial fraction) realisation of IIR filters
+#
+import unittest
+import numpy as np
+from scipy import signal
+try:
+    from . import iir_filter
+except ImportError:
+    import iir_filter
+
+
+def _residues(sos, tol):
+    """Poles, residues and direct terms of a cascade in z^-1. The poles
+    are found section by section and the residues are evaluated in
+    product form which is more accurate than expanding the cascade
+    into one transfer function."""
+    sos = np.asarray(sos, dtype=float)
+    numerators = [np.trim_zeros(s[:3], 'b') for s in sos]
+    denominators = [np.trim_zeros(s[3:], 'b') for s in sos]
+    p = np.concatenate([np.roots(a) for a in denominators]).astype(complex)
+    if len(p) > 1:
+        d = np.abs(p[:, None] - p[None, :]) + np.eye(len(p))
+        if d.min() < np.sqrt(tol):
+            raise ValueError("Repeated poles have no parallel form with first and second order branches")
+    degree = sum(len(b) - 1 for b in numerators)
+    if degree > len(p):
+        b, a = signal.sos2tf(sos)
+        r, p, k = signal.residuez(b, a)
+        return p, r, k
+    r = np.ones(len(p), dtype=complex)
+    for i, pi in enumerate(p):
+        for b in numerators:
+            r[i] *= np.polyval(b[::-1], 1 / pi)
+        r[i] /= np.prod(1 - np.delete(p, i) / pi)
+    k = np.zeros(0)
+    if degree == len(p):
+        k = np.array([np.prod([b[-1] for b in numerators]) / np.prod([a[-1] for a in denominators])])
+    return p, r, k
+
+
+def sos2parallel(sos, tol=1e-9):
+    """Converts a cascade into a sum of first and second order branches
+    by a partial fraction expansion. Complex conjugate poles and pairs
+    of real poles form second order branches, a left over real pole a
+    first order one. Repeated poles are not supported.
+    sos -- array of 2nd order IIR filter coefficients
+    tol -- tolerance below which the imaginary part of a pole is zero
+    returns the branches as sos rows [b0, b1, 0, 1, a1, a2] and the
+    direct (FIR) terms
+    """
+    p, r, k = _residues(sos, tol)
+    branches = []
+    real = []
+    for ri, pi in zip(r, p):
+        if abs(pi.imag) <= tol * max(1, abs(pi)):
+            real.append((ri.real, pi.real))
+        elif pi.imag > 0:
+            branches.append([2 * ri.real, -2 * (ri * np.conj(pi)).real, 0,
+                             1, -2 * pi.real, abs(pi) ** 2])
+    real.sort(key=lambda rp: rp[1])
+    for (r1, p1), (r2, p2) in zip(real[0::2], real[1::2]):
+        branches.append([r1 + r2, -(r1 * p2 + r2 * p1), 0, 1, -(p1 + p2), p1 * p2])
+    if len(real) % 2:
+        r1, p1 = real[-1]
+        branches.append([r1, 0, 0, 1, -p1, 0])
+    return np.array(branches, dtype=float).reshape(-1, 6), np.real(k).astype(float)
+
+
+class IIR_filter_parallel:
+    """IIR filter in parallel form. All branches are independent and
+    are evaluated together: the states of the branches, the history of
+    the direct terms and the input form one vector which is updated
+    with one matrix product per sample."""
+
+    def __init__(self, sos):
+        """Instantiates a parallel form IIR filter
+        sos -- array of 2nd order IIR filter coefficients
+        """
+        branches, self.direct = sos2parallel(sos)
+        self.numerator0 = branches[:, 0]
+        self.numerator1 = branches[:, 1]
+        self.denominator1 = branches[:, 4]
+        self.denominator2 = branches[:, 5]
+        nb = len(branches)
+        nh = max(len(self.direct) - 1, 0)
+        n = 2 * nb + nh
+        # z = [w1, w2 of every branch, input history, input]
+        self._z = np.zeros(n + 1)
+        # (branches x 2) delay lines and the history of the direct terms
+        self.state = self._z[:2 * nb].reshape(nb, 2)
+        self.history = self._z[2 * nb:n]
+        # the new states and the output in rows 0..n-1 and n
+        m = np.zeros((n + 1, n + 1))
+        b0, b1, a1, a2 = self.numerator0, self.numerator1, self.denominator1, self.denominator2
+        for i in range(nb):
+            w1 = 2 * i
+            # input = v - a1 * w1 - a2 * w2 which becomes the new w1
+            m[w1, w1], m[w1, w1 + 1], m[w1, n] = -a1[i], -a2[i], 1
+            m[w1 + 1, w1] = 1
+            # output = b0 * input + b1 * w1
+            m[n, w1] = b1[i] - b0[i] * a1[i]
+            m[n, w1 + 1] = -b0[i] * a2[i]
+            m[n, n] += b0[i]
+        if len(self.direct):
+            m[n, n] += self.direct[0]
+        for k in range(nh):
+            # the history holds the oldest input first
+            m[2 * nb + k, 2 * nb + k + 1] = 1
+            m[n, 2 * nb + k] = self.direct[nh - k]
+        self._m = m
+
+    def _direct(self, x):
+        """Direct terms of the partial fraction expansion"""
+        if len(self.direct) == 0:
+            return 0.0
+        ext = np.concatenate((self.history, x))
+        if len(self.history):
+            self.history[:] = ext[-len(self.history):]
+        return np.convolve(ext, self.direct, 'valid')
+
+    def filter(self, v):
+        """Sample by sample filtering
+        v -- scalar sample
+        returns filtered sample
+        """
+        z = self._z
+        z[-1] = v
+        r = self._m @ z
+        z[:-1] = r[:-1]
+        return float(r[-1])
+
+    def filter_block(self, x):
+        """Block filtering which shares its state with filter()
+        x -- 1D numpy array of samples
+        returns filtered array
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.zeros(len(x)) + self._direct(x)
+        if len(x) == 0:
+            return y
+        s = self.state
+        for i in range(len(s)):
+            yi, s[i, 0], s[i, 1] = iir_filter._df2_block(
+                self.numerator0[i], self.numerator1[i], 0.0,
+                self.denominator1[i], self.denominator2[i], x, s[i, 0], s[i, 1])
+            y += yi
+        return y
+
+
+class TestParallel(unittest.TestCase):
+
+    def compare(self, sos):
+        x = np.random.default_rng(14).standard_normal(300)
+        y = iir_filter.IIR_filter(sos).filter_block(x)
+        f = IIR_filter_parallel(sos)
+        yp = np.concatenate((f.filter_block(x[:100]),
+                             [f.filter(v) for v in x[100:120]],
+                             f.filter_block(x[120:])))
+        np.testing.assert_allclose(yp, y, atol=1e-8)
+
+    def test_lowpass(self):
+        self.compare(signal.butter(9, 0.2, output='sos'))
+
+    def test_bandstop(self):
+        self.compare(signal.butter(4, [0.096, 0.104], 'bandstop', output='sos'))
+
+    def test_direct_terms(self):
+        self.compare(np.array([[1, 0.5, 0.2, 1, 0, 0], [1, -0.3, 0, 1, -0.5, 0.1]]))
+        self.compare(np.array([[1, 0.5, 0.2, 1, -0.5, 0.1], [1, -0.3, 0, 1, 0.2, 0]]))
+
+    def test_repeated_poles(self):
+        s = [0.1, 0.2, 0.1, 1, -1.2, 0.5]
+        self.assertRaises(ValueError, IIR_filter_parallel, [s, s])
+
+
+if __name__ == '__main__':
+    unittest.main()
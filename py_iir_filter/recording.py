@@ -0,0 +1,97 @@
+#
+# Loader for text recordings with a binary, memory mapped sidecar cache
+#
+import itertools
+import os
+import unittest
+import numpy as np
+
+
+def sidecar_path(path):
+    """Name of the binary sidecar of a text recording"""
+    return path + '.npy'
+
+
+def _convert(path, sidecar, chunk_size):
+    """Parses a text recording chunk by chunk into a .npy file"""
+    with open(path) as f:
+        # the same rows which loadtxt keeps: not empty without the comments
+        rows = sum(1 for line in f if line.split('#', 1)[0].strip())
+        f.seek(0)
+        tmp = "{}.{}.tmp".format(sidecar, os.getpid())
+        out = None
+        i = 0
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            if not any(line.split('#', 1)[0].strip() for line in lines):
+                continue
+            chunk = np.loadtxt(lines, ndmin=2)
+            if out is None:
+                out = np.lib.format.open_memmap(tmp, 'w+', dtype=float, shape=(rows, chunk.shape[1]))
+            out[i:i + len(chunk)] = chunk
+            i += len(chunk)
+        if out is None:
+            out = np.lib.format.open_memmap(tmp, 'w+', dtype=float, shape=(0, 1))
+        out.flush()
+        del out
+    # the sidecar carries the mtime of the source it was made from
+    st = os.stat(path)
+    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp, sidecar)
+
+
+def load_recording(path, mmap=True, chunk_size=65536):
+    """Loads a text recording such as ecg_50hz_1.dat. The text is parsed
+    only once into a binary sidecar file which is memory mapped on
+    later loads. The sidecar is rebuilt when the mtime of the source
+    file changes.
+    path -- text recording with one sample per row
+    mmap -- memory map the sidecar instead of reading it into memory
+    chunk_size -- number of rows parsed at a time during conversion
+    returns a (rows x columns) read-only memmap or array
+    """
+    sidecar = sidecar_path(path)
+    try:
+        valid = os.stat(sidecar).st_mtime_ns == os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        valid = False
+    if not valid:
+        _convert(path, sidecar, chunk_size)
+    return np.load(sidecar, mmap_mode='r' if mmap else None)
+
+
+class TestRecording(unittest.TestCase):
+
+    def test_sidecar(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as path:
+            src = os.path.join(path, 'r.dat')
+            d = np.column_stack((np.arange(100), np.arange(100) * 3))
+            np.savetxt(src, d, fmt='%d')
+            r = load_recording(src, chunk_size=7)
+            self.assertIsInstance(r, np.memmap)
+            np.testing.assert_array_equal(r, d)
+            # the filters use the memmap without copying it
+            self.assertTrue(np.shares_memory(np.asarray(r[:, 1], dtype=float), r))
+            mtime = os.stat(sidecar_path(src)).st_mtime_ns
+            load_recording(src)
+            self.assertEqual(os.stat(sidecar_path(src)).st_mtime_ns, mtime)
+            del r
+            np.savetxt(src, d[:50] * 2, fmt='%d')
+            st = os.stat(src)
+            os.utime(src, ns=(st.st_atime_ns, mtime - 10 ** 9))
+            np.testing.assert_array_equal(load_recording(src, mmap=False), d[:50] * 2)
+
+    def test_comments(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as path:
+            src = os.path.join(path, 'r.dat')
+            with open(src, 'w') as f:
+                f.write('# t x\n1 2\n\n3 4 # c\n# c\n5 6\n# end\n')
+            np.testing.assert_array_equal(load_recording(src, chunk_size=2), np.loadtxt(src))
+
+
+if __name__ == '__main__':
+    unittest.main()
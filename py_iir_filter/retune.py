@@ -0,0 +1,121 @@
+#
+# IIR filter whose cutoff can be changed while it is running
+#
+import bisect
+import unittest
+import numpy as np
+try:
+    from . import iir_filter
+    from . import design_cache
+except ImportError:
+    import iir_filter
+    import design_cache
+
+
+class IIR_filter_retunable:
+    """IIR filter with a precomputed table of designs over a range of
+    cutoff frequencies. Switching the cutoff only replaces the
+    coefficients of the sections and keeps their states so that there
+    is no glitch and no design call in the control loop."""
+
+    def __init__(self, cutoffs, order=2, btype='low', fs=None, ftype='butter', interpolate=False):
+        """Instantiates a retunable IIR filter
+        cutoffs -- cutoff frequencies of the table (ascending)
+        order -- filter order
+        btype -- 'lowpass' or 'highpass'
+        fs -- sampling rate; cutoffs are normalised to Nyquist if None
+        ftype -- design type, see design_cache.design()
+        interpolate -- interpolate the coefficients between neighbouring
+                       cutoffs instead of using the nearest one
+        """
+        self.cutoffs = np.asarray(cutoffs, dtype=float)
+        self.table = np.array([design_cache.design(ftype, order, fc, btype, fs) for fc in self.cutoffs])
+        self._rows = [sos.tolist() for sos in self.table]
+        self.interpolate = interpolate
+        step = np.diff(self.cutoffs)
+        # evenly spaced cutoffs are looked up without searching
+        self._step = step[0] if len(step) and np.allclose(step, step[0]) else None
+        self.iir = iir_filter.IIR_filter(self.table[0])
+        self.cutoff = self.cutoffs[0]
+
+    def _set_coefficients(self, sos):
+        for f, s in zip(self.iir.cascade, sos):
+            f.numerator0, f.numerator1, f.numerator2 = s[0], s[1], s[2]
+            f.denominator1, f.denominator2 = s[4], s[5]
+
+    def _position(self, cutoff):
+        """Index of the table entry below the cutoff and the fractional
+        position towards the next one"""
+        c = self.cutoffs
+        cutoff = min(max(cutoff, c[0]), c[-1])
+        if self._step is not None:
+            i = min(int((cutoff - c[0]) / self._step), len(c) - 1)
+        else:
+            i = bisect.bisect_right(c, cutoff) - 1
+        if i == len(c) - 1:
+            return i, 0.0
+        return i, (cutoff - c[i]) / (c[i + 1] - c[i])
+
+    def set_index(self, i):
+        """Switches to the i-th design of the table"""
+        self._set_coefficients(self._rows[i])
+        self.cutoff = self.cutoffs[i]
+
+    def set_cutoff(self, cutoff):
+        """Switches to the design for the cutoff, clamped to the range
+        of the table. Linear interpolation of the biquad coefficients
+        keeps the filter stable as the stability triangle is convex.
+        cutoff -- new cutoff frequency
+        """
+        i, t = self._position(cutoff)
+        if not self.interpolate:
+            self.set_index(i + 1 if t > 0.5 else i)
+            return
+        if t == 0:
+            self._set_coefficients(self._rows[i])
+        else:
+            self._set_coefficients(((1 - t) * self.table[i] + t * self.table[i + 1]).tolist())
+        self.cutoff = cutoff
+
+    def filter(self, v):
+        """Sample by sample filtering
+        v -- scalar sample
+        returns filtered sample
+        """
+        return self.iir.filter(v)
+
+    def filter_block(self, x):
+        """Block filtering which shares its state with filter()
+        x -- 1D numpy array of samples
+        returns filtered array
+        """
+        return self.iir.filter_block(x)
+
+
+class TestRetune(unittest.TestCase):
+
+    def test_switch(self):
+        f = IIR_filter_retunable(np.arange(5, 50, 5), fs=200)
+        f.set_cutoff(21)
+        self.assertEqual(f.cutoff, 20)
+        ref = iir_filter.IIR_filter(design_cache.butter(2, 20, fs=200))
+        x = np.random.default_rng(15).standard_normal(100)
+        np.testing.assert_allclose(f.filter_block(x[:50]), ref.filter_block(x[:50]))
+        # the states are carried over when switching
+        f.set_cutoff(40)
+        ref2 = iir_filter.IIR_filter(design_cache.butter(2, 40, fs=200))
+        for s, r in zip(ref2.cascade, ref.cascade):
+            s.buffer1, s.buffer2 = r.buffer1, r.buffer2
+        np.testing.assert_allclose([f.filter(v) for v in x[50:]], ref2.filter_block(x[50:]))
+
+    def test_interpolate(self):
+        f = IIR_filter_retunable([10, 20, 40], fs=200, interpolate=True)
+        f.set_cutoff(30)
+        np.testing.assert_allclose([[s.numerator0, s.denominator1] for s in f.iir.cascade],
+                                   (f.table[1] + f.table[2])[:, [0, 4]] / 2)
+        f.set_cutoff(100)
+        self.assertEqual(f.iir.cascade[0].denominator2, f.table[2][0][5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#
+# Fixed capacity ring buffer with an ordered zero-copy view
+#
+import unittest
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed capacity ring buffer of samples. Every sample is stored
+    twice, at its position and one capacity further, so that the
+    samples from the oldest to the newest are always one contiguous
+    slice: appending is O(1) and view() never copies."""
+
+    def __init__(self, capacity, dtype=float):
+        """Instantiates a ring buffer filled with zeros
+        capacity -- number of samples
+        dtype -- data type of the samples
+        """
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+        self._index = 0
+
+    def __len__(self):
+        return self.capacity
+
+    def append(self, v):
+        """Appends one sample and drops the oldest one
+        v -- scalar sample
+        """
+        i = self._index
+        self._data[i] = v
+        self._data[i + self.capacity] = v
+        i += 1
+        self._index = 0 if i == self.capacity else i
+
+    def extend(self, x):
+        """Appends a block of samples and drops the oldest ones
+        x -- 1D array of samples
+        """
+        c = self.capacity
+        x = np.asarray(x)[-c:]
+        n = len(x)
+        i = self._index
+        first = min(n, c - i)
+        self._data[i:i + first] = x[:first]
+        self._data[i + c:i + c + first] = x[:first]
+        rest = n - first
+        self._data[:rest] = x[first:]
+        self._data[c:c + rest] = x[first:]
+        self._index = (i + n) % c
+
+    def view(self):
+        """Returns the samples from the oldest to the newest without
+        copying them. The view changes with the following appends."""
+        return self._data[self._index:self._index + self.capacity]
+
+    def copy(self):
+        """Returns a copy of the samples from the oldest to the newest"""
+        return self.view().copy()
+
+    def latest(self):
+        """Returns the newest sample"""
+        return self._data[self._index + self.capacity - 1]
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_append(self):
+        r = RingBuffer(4)
+        ref = np.zeros(4)
+        for v in range(10):
+            r.append(v)
+            ref = np.roll(ref, -1)
+            ref[-1] = v
+            np.testing.assert_array_equal(r.view(), ref)
+        self.assertEqual(r.latest(), 9)
+
+    def test_extend(self):
+        r = RingBuffer(5)
+        ref = np.zeros(5)
+        x = np.arange(1, 40, dtype=float)
+        for n in (2, 3, 1, 7, 0, 5, 4):
+            block, x = x[:n], x[n:]
+            r.extend(block)
+            ref = np.concatenate((ref, block))[-5:]
+            np.testing.assert_array_equal(r.view(), ref)
+        self.assertTrue(np.shares_memory(r.view(), r._data))
+
+
+if __name__ == '__main__':
+    unittest.main()
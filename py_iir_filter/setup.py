@@ -12,8 +12,9 @@ setup(
     long_description=long_description,
     author='Bernd Porr',
     author_email='mail@berndporr.me.uk',
-    py_modules=['iir_filter'],
+    py_modules=['iir_filter', 'design_cache', 'zero_phase', 'batch', 'recording', 'fixed_point', 'decimator', 'parallel', 'retune', 'ring_buffer', 'spectrum'],
     install_requires=['numpy'],
+    extras_require={'design': ['scipy']},
     zip_safe=False,
     url='https://github.com/berndporr/py-iir-filter',
     license='GPL 3.0',
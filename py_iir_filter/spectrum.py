@@ -0,0 +1,226 @@
+#
+# Incremental spectra of streams
+#
+import functools
+import threading
+import unittest
+import numpy as np
+try:
+    from .ring_buffer import RingBuffer
+except ImportError:
+    from ring_buffer import RingBuffer
+
+
+class SlidingDFT:
+    """Sliding DFT over the last n samples. Each new sample updates the
+    selected bins in O(bins) instead of recomputing a whole FFT. To stop
+    rounding errors from accumulating the bins are recomputed with an
+    FFT every resync samples."""
+
+    def __init__(self, n, bins=None, resync=None):
+        """Instantiates a sliding DFT with a window of n samples
+        n -- window length
+        bins -- indices of the rfft bins to track (0 to n // 2), default all
+        resync -- number of samples between exact recomputations,
+                  default n
+        """
+        self.n = n
+        self.bins = np.arange(n // 2 + 1) if bins is None else np.asarray(bins)
+        self.resync = n if resync is None else resync
+        self.buffer = RingBuffer(n)
+        self.spectrum = np.zeros(len(self.bins), dtype=complex)
+        self._twiddle = np.exp(2j * np.pi * self.bins / n)
+        self._count = 0
+
+    def frequencies(self, fs):
+        """Frequencies of the tracked bins
+        fs -- sampling rate
+        """
+        return self.bins * fs / self.n
+
+    def _tick(self, n):
+        self._count += n
+        if self._count >= self.resync:
+            self._count = 0
+            self.spectrum = np.fft.rfft(self.buffer.view())[self.bins]
+
+    def update(self, v):
+        """Adds one sample
+        v -- scalar sample
+        returns the complex spectrum of the tracked bins
+        """
+        old = self.buffer.view()[0]
+        self.buffer.append(v)
+        self.spectrum = (self.spectrum + (v - old)) * self._twiddle
+        self._tick(1)
+        return self.spectrum
+
+    def update_block(self, x):
+        """Adds a block of samples in one vectorized step
+        x -- 1D array of samples
+        returns the complex spectrum of the tracked bins
+        """
+        x = np.asarray(x, dtype=float)
+        m = len(x)
+        if m == 0:
+            return self.spectrum
+        if m >= self.n:
+            # the whole window is replaced
+            self.buffer.extend(x)
+            self._count = self.resync
+            self._tick(0)
+            return self.spectrum
+        d = x - self.buffer.view()[:m]
+        self.buffer.extend(x)
+        # each difference is rotated by the number of steps it has been in the window
+        powers = self._twiddle[None, :] ** np.arange(m, 0, -1)[:, None]
+        self.spectrum = self.spectrum * self._twiddle ** m + d @ powers
+        self._tick(m)
+        return self.spectrum
+
+    def magnitude(self):
+        """Returns the magnitude spectrum of the tracked bins"""
+        return np.abs(self.spectrum)
+
+
+@functools.lru_cache(maxsize=32)
+def get_window(name, n):
+    """Cached periodic window of n samples, the same as scipy's
+    get_window for 'hann', 'hamming', 'blackman' and 'boxcar'"""
+    x = 2 * np.pi * np.arange(n) / n
+    if name == 'hann':
+        w = 0.5 - 0.5 * np.cos(x)
+    elif name == 'hamming':
+        w = 0.54 - 0.46 * np.cos(x)
+    elif name == 'blackman':
+        w = 0.42 - 0.5 * np.cos(x) + 0.08 * np.cos(2 * x)
+    elif name == 'boxcar':
+        w = np.ones(n)
+    else:
+        raise ValueError("Unknown window {}".format(name))
+    w.setflags(write=False)
+    return w
+
+
+def welch(x, fs, nperseg=256, overlap=0.5, window='hann'):
+    """Power spectral density with Welch's method: the periodograms of
+    overlapping, windowed and mean-free segments are averaged
+    x -- 1D array of samples
+    fs -- sampling rate
+    nperseg -- segment length, shortened to len(x) if needed
+    overlap -- fraction by which the segments overlap
+    window -- window name, see get_window()
+    returns the frequencies and the one-sided PSD
+    """
+    x = np.asarray(x, dtype=float)
+    nperseg = min(nperseg, len(x))
+    step = max(1, int(round(nperseg * (1 - overlap))))
+    w = get_window(window, nperseg)
+    segments = np.lib.stride_tricks.sliding_window_view(x, nperseg)[::step]
+    segments = segments - segments.mean(axis=1, keepdims=True)
+    p = np.abs(np.fft.rfft(segments * w, axis=1)) ** 2
+    p = p.mean(axis=0) / (fs * np.dot(w, w))
+    # one-sided: the negative frequencies are folded onto the positive ones
+    if nperseg % 2:
+        p[1:] *= 2
+    else:
+        p[1:-1] *= 2
+    return np.fft.rfftfreq(nperseg, 1 / fs), p
+
+
+class WelchPSD(threading.Thread):
+    """Running Welch PSD estimate which is updated from a background
+    thread at a fixed rate, independent of the arrival of the samples.
+    Every update is blended into an exponential average."""
+
+    def __init__(self, source, fs, nperseg=256, overlap=0.5, window='hann', alpha=0.2, rate=10.0):
+        """Instantiates a PSD estimator, call start() to run it
+        source -- callable which returns the latest samples as an array
+        fs -- sampling rate
+        nperseg -- segment length
+        overlap -- fraction by which the segments overlap
+        window -- window name, see get_window()
+        alpha -- weight of a new estimate in the exponential average
+        rate -- updates per second
+        """
+        super(WelchPSD, self).__init__()
+        self.daemon = True
+        self.source = source
+        self.fs = fs
+        self.nperseg = nperseg
+        self.overlap = overlap
+        self.window = window
+        self.alpha = alpha
+        self.rate = rate
+        self.frequencies = None
+        self.psd = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def update(self):
+        """Calculates a new estimate from the source and averages it"""
+        f, p = welch(self.source(), self.fs, self.nperseg, self.overlap, self.window)
+        with self._lock:
+            if self.psd is None or len(p) != len(self.psd):
+                self.psd = p
+            else:
+                self.psd = (1 - self.alpha) * self.psd + self.alpha * p
+            self.frequencies = f
+
+    def get(self):
+        """Returns the frequencies and the averaged PSD (None before
+        the first update)"""
+        with self._lock:
+            return self.frequencies, self.psd
+
+    def run(self):
+        while not self._stop_event.wait(1 / self.rate):
+            self.update()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class TestSpectrum(unittest.TestCase):
+
+    def test_sliding_dft(self):
+        x = np.random.default_rng(16).standard_normal(500)
+        s = SlidingDFT(64, resync=1000)
+        for i, v in enumerate(x[:100]):
+            s.update(v)
+        s.update_block(x[100:110])
+        s.update_block(x[110:200])
+        s.update(x[200])
+        np.testing.assert_allclose(s.spectrum, np.fft.rfft(x[137:201]), atol=1e-9)
+
+    def test_bins(self):
+        x = np.random.default_rng(17).standard_normal(300)
+        s = SlidingDFT(50, bins=np.arange(1, 25), resync=7)
+        for v in x:
+            s.update(v)
+        np.testing.assert_allclose(s.magnitude(), np.abs(np.fft.fft(x[-50:])[1:25]), atol=1e-9)
+        np.testing.assert_allclose(s.frequencies(200), np.fft.fftfreq(50, 1 / 200)[1:25])
+
+    def test_welch(self):
+        from scipy import signal
+        x = np.random.default_rng(18).standard_normal(1000) + 3
+        for window in ('hann', 'hamming', 'blackman', 'boxcar'):
+            f, p = welch(x, 200, 128, 0.5, window)
+            fr, pr = signal.welch(x, 200, window, 128, 64)
+            np.testing.assert_allclose(f, fr)
+            np.testing.assert_allclose(p, pr, rtol=1e-10, atol=1e-20)
+        self.assertIs(get_window('hann', 128), get_window('hann', 128))
+
+    def test_welch_thread(self):
+        x = np.random.default_rng(19).standard_normal(500)
+        psd = WelchPSD(lambda: x, 100, 64, rate=200)
+        self.assertEqual(psd.get(), (None, None))
+        psd.start()
+        psd._stop_event.wait(0.1)
+        psd.stop()
+        psd.join()
+        np.testing.assert_allclose(psd.get()[1], welch(x, 100, 64)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#
+# Zero-phase (forward-backward) filtering of long recordings
+#
+import unittest
+import numpy as np
+try:
+    from . import iir_filter
+except ImportError:
+    import iir_filter
+
+
+def zero_phase_filter(sos, x, out=None, chunk_size=65536, padlen=None):
+    """Forward-backward filtering with bounded memory. Only chunks of
+    the input are read at a time so that x can be a memory mapped file.
+    The edges are handled as in scipy's sosfiltfilt with an odd extension
+    of the signal and steady state initial conditions.
+    sos -- array of 2nd order IIR filter coefficients
+    x -- 1D array (or memmap) of samples
+    out -- optional output array (or memmap) of the same length as x
+    chunk_size -- number of samples processed per block
+    padlen -- length of the odd extension at both ends
+    returns the zero-phase filtered signal
+    """
+    sos = np.asarray(sos)
+    n = len(x)
+    if padlen is None:
+        ntaps = 2 * len(sos) + 1
+        ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+        padlen = 3 * ntaps
+    if n <= padlen:
+        raise ValueError("The length of the input must be larger than padlen ({})".format(padlen))
+    if out is None:
+        out = np.empty(n)
+    elif len(out) != n:
+        raise ValueError("out must have the same length as x")
+    x0 = float(x[0])
+    x1 = float(x[n - 1])
+    pre = 2 * x0 - np.asarray(x[1:padlen + 1], dtype=float)[::-1]
+    post = 2 * x1 - np.asarray(x[n - padlen - 1:n - 1], dtype=float)[::-1]
+
+    # forward pass, the output of the pre-extension is not needed
+    f = iir_filter.IIR_filter(sos)
+    f.set_steady_state(pre[0] if padlen else x0)
+    f.filter_block(pre)
+    for i in range(0, n, chunk_size):
+        out[i:i + chunk_size] = f.filter_block(x[i:i + chunk_size])
+    post = f.filter_block(post)
+
+    # backward pass from the end of the post-extension
+    b = iir_filter.IIR_filter(sos)
+    b.set_steady_state(post[-1] if padlen else out[n - 1])
+    b.filter_block(post[::-1])
+    for i in range((n - 1) // chunk_size * chunk_size, -1, -chunk_size):
+        out[i:i + chunk_size] = b.filter_block(out[i:i + chunk_size][::-1])[::-1]
+    return out
+
+
+class TestZeroPhase(unittest.TestCase):
+
+    sos = [[1.78260999e-03, 3.56521998e-03, 1.78260999e-03,
+            1.00000000e+00, -1.25544047e+00, 4.09013783e-01],
+           [1.00000000e+00, 2.00000000e+00, 1.00000000e+00,
+            1.00000000e+00, -1.51824184e+00, 7.03962657e-01]]
+
+    def test_sosfiltfilt(self):
+        from scipy import signal
+        x = np.cumsum(np.random.default_rng(5).standard_normal(1000))
+        y = signal.sosfiltfilt(self.sos, x)
+        np.testing.assert_allclose(zero_phase_filter(self.sos, x, chunk_size=97), y, atol=1e-9)
+        np.testing.assert_allclose(zero_phase_filter(self.sos, x, padlen=0), signal.sosfiltfilt(self.sos, x, padlen=0), atol=1e-9)
+
+    def test_memmap(self):
+        import os
+        import tempfile
+        x = np.random.default_rng(6).standard_normal(500)
+        with tempfile.TemporaryDirectory() as path:
+            np.save(os.path.join(path, 'x.npy'), x)
+            xm = np.load(os.path.join(path, 'x.npy'), mmap_mode='r')
+            out = np.lib.format.open_memmap(os.path.join(path, 'y.npy'), 'w+', shape=(500,))
+            zero_phase_filter(self.sos, xm, out=out, chunk_size=64)
+            np.testing.assert_allclose(out, zero_phase_filter(self.sos, x), atol=1e-12)
+            del out, xm
+
+
+if __name__ == '__main__':
+    unittest.main()